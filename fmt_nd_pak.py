@@ -19,6 +19,9 @@ PrintMaterialParams = False										# Print out all material parameters in the
 texoutExt = ".dds"												# Extension of texture files (change to load textures of a specific type in Blender)
 gameName = "U4"													# Default game name
 ReparentHelpers = 2												# Parents helper bones based on their names, mostly for TLOU models. Set to 2 for Auto
+UseParseCache = False											# Cache parsed pak headers and geometry descriptors in Noesis\Plugins\Python\NDPakCache\, so reopening the same paks is faster
+ShareInstancedMeshes = False									# Import instanced props once, placed at the first placement and weighted to its "<mesh>#0" bone, with a "<mesh>#<n>" bone marking each other placement, instead of a transformed copy of the mesh per placement
+ParallelPakLoads = False										# Parse the headers of the other paks selected in the dialog on worker threads. Parsing is pure Python, so this rarely helps; geometry is still decoded one submesh at a time when committed
 
 
 # Set the base path from which the plugin will search for pak files and textures:
@@ -30,15 +33,18 @@ BaseDirectories = {
 }
 
 from inc_noesis import *
+from inc_nd_pak import *
 from collections import namedtuple
 import noewin
 import json
 import os
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-class DialogOptions:
+class DialogOptions(PakOptions):
 	def __init__(self):
+		PakOptions.__init__(self)
 		self.doLoadTex = LoadTextures
 		self.doLoadBase = LoadBaseSkeleton
 		self.doConvertTex = ConvertTextures
@@ -48,18 +54,20 @@ class DialogOptions:
 		self.printMaterialParams = PrintMaterialParams
 		self.reparentHelpers = ReparentHelpers
 		self.readColors = ReadColors
+		self.shareInstances = ShareInstancedMeshes
 		self.baseSkeleton = None
 		self.width = 600
 		self.height = 850
-		self.texDicts = None
+		self.texDB = None
+		self.texIndexes = None
+		self.dictFiles = FileHandlePool() #global/world texture dicts kept open while loading textures
 		self.gameName = gameName
 		self.currentDir = ""
-		self.isTLOU2 = False
-		self.isTLOUP1 = False
+		self.texoutExt = texoutExt
+		self.cacheDir = (noesis.getPluginsPath() + "python\\NDPakCache") if UseParseCache else None
 		self.dialog = None
 
 dialogOptions = DialogOptions()
-ResItemPaddingSz = 32
 
 def registerNoesisTypes():
 	handle = noesis.register("Naughty Dog PAK", ".pak")
@@ -68,6 +76,7 @@ def registerNoesisTypes():
 	noesis.addOption(handle, "-t", "Textures only; do not inject geometry data", 0)
 	noesis.addOption(handle, "-bones", "Write bone positions", 0)
 	noesis.addOption(handle, "-lods", "Import/Export with all LODs", 0)
+	noesis.addOption(handle, "-instances", "Import instanced meshes once, weighted to the first of a helper bone per placement", 0)
 	noesis.addOption(handle, "-meshfile", "Export using a given source mesh filepath", noesis.OPTFLAG_WANTARG)
 	noesis.addOption(handle, "-texfolder", "Export using a given textures folder for embedding", noesis.OPTFLAG_WANTARG)
 	noesis.setHandlerTypeCheck(handle, pakCheckType)
@@ -99,34 +108,6 @@ def getGameName():
 		return "TLOUP1"
 	return gameName
 
-def findNextOf(bs, integer, is64=False):
-	start = bs.tell()
-	while not bs.checkEOF() and ((is64 and bs.readInt64()) or bs.readInt()) != integer:
-		pass
-	output = bs.tell()
-	bs.seek(start)
-	return output
-
-def readStringAt(bs, offset):
-	start = bs.tell()
-	bs.seek(offset)
-	output = bs.readString()
-	bs.seek(start)
-	return output
-	
-def readUIntAt(bs, offset):
-	start = bs.tell()
-	bs.seek(offset)
-	output = bs.readUInt()
-	bs.seek(start)
-	return output 
-	
-def writeUIntAt(bs, offset, value):
-	start = bs.tell()
-	bs.seek(offset)
-	bs.writeUInt(value)
-	bs.seek(start)
-	
 def findRootDir(path):
 	uncharted4Idx = path.find("\\uncharted4\\")
 	if uncharted4Idx != -1:
@@ -139,11 +120,6 @@ def findRootDir(path):
 		return path[:(tlou2Idx + 10)]
 	return path
 
-def readFileBytes(filepath, address, size):
-	with open(filepath, 'rb') as f:
-		f.seek(address)
-		return f.read(size)
-
 def generateDummyTexture4px(rgbaColor, name="Dummy"):
 	imageByteList = []
 	for i in range(16):
@@ -894,224 +870,6 @@ dxFormat = {
 	0x64: "B16G16R16A16_Float" 
 }
 
-gdRawDataStarts = {
-	"U4": {
-		"All": {
-			"global-dict.pak":  940048,
-			"global-dict-1.pak":  1083904,
-			"global-dict-2.pak":  959456,
-			"global-dict-3.pak":  1041088,
-			"global-dict-4.pak":  924576,
-			"global-dict-5.pak":  1013456,
-			"global-dict-6.pak":  781216,
-			"global-dict-7.pak":  740640,
-			"global-dict-8.pak":  853104,
-			"global-dict-9.pak":  551888,
-			"global-dict-10.pak":  301056,
-			"global-dict-11.pak":  923936,
-			"global-dict-12.pak":  850656,
-			"global-dict-13.pak":  839584,
-			"global-dict-14.pak":  229456,
-			"global-dict-15.pak":  227216,
-			"global-dict-16.pak":  277968,
-			"global-dict-17.pak":  192960,
-			"global-dict-18.pak":  448832,
-			"global-dict-19.pak":  506752,
-			"global-dict-20.pak":  391920,
-		},
-	},
-	"TLL": {
-		"All": {
-			"global-dict.pak": 1040608,
-			"global-dict-1.pak": 949568,
-			"global-dict-2.pak": 1081104,
-			"global-dict-3.pak": 574688,
-			"global-dict-4.pak": 748944,
-			"global-dict-5.pak": 546608,
-			"global-dict-6.pak": 1074032,
-			"global-dict-7.pak": 911984,
-			"global-dict-8.pak": 247632,
-			"global-dict-9.pak": 131072,
-			"global-dict-10.pak": 140048,
-			"global-dict-11.pak": 488656,
-			"global-dict-12.pak": 79440,
-		},
-	},
-	"TLOUP1": {
-		"common": {
-			"common-dict.pak": 490768,
-		},
-		"sp-common": {
-			"sp-common-dict-1.pak": 1308752,
-			"sp-common-dict-2.pak": 1312512,
-			"sp-common-dict-3.pak": 1179152,
-			"sp-common-dict.pak": 1568992,
-		},
-		"world-bills": {
-			"world-bills-dict-1.pak": 707792,
-			"world-bills-dict.pak": 1335136,
-		},
-		"world-game-start": {
-			"world-game-start-dict.pak": 41680,
-		},
-		"world-home": {
-			"world-home-dict-1.pak": 1099808,
-			"world-home-dict-2.pak": 248576,
-			"world-home-dict.pak": 1250192,
-		},
-		"world-hunter-city": {
-			"world-hunter-city-dict-1.pak": 1020592,
-			"world-hunter-city-dict-2.pak": 316576,
-			"world-hunter-city-dict-3.pak": 1371984,
-			"world-hunter-city-dict-4.pak": 17552,
-			"world-hunter-city-dict.pak": 1406560,
-		},
-		"world-lab": {
-			"world-lab-dict.pak": 329248,
-		},
-		"world-lakeside": {
-			"world-lakeside-dict-1.pak": 481088,
-			"world-lakeside-dict.pak": 1212656,
-		},
-		"world-mall": {
-			"world-mall-dict-1.pak": 1084928,
-			"world-mall-dict-2.pak": 209008,
-			"world-mall-dict.pak": 1378112,
-		},
-		"world-military-city": {
-			"world-military-city-dict-1.pak": 1205728,
-			"world-military-city-dict-2.pak": 634832,
-			"world-military-city-dict.pak": 1291008,
-		},
-		"world-outskirts": {
-			"world-outskirts-dict-1.pak": 686208,
-			"world-outskirts-dict-2.pak": 689200,
-			"world-outskirts-dict.pak": 1352992,
-		},
-		"world-suburbs": {
-			"world-suburbs-dict-1.pak": 229472,
-			"world-suburbs-dict.pak": 1078272,
-		},
-		"world-tommys-dam": {
-			"world-tommys-dam-dict-1.pak": 422544,
-			"world-tommys-dam-dict.pak": 810576,
-		},
-		"world-university": {
-			"world-university-dict.pak": 301072,
-		},
-		"world-wild": {
-			"world-wild-dict.pak": 440240,
-		},
-	},
-	"TLOU2": {
-		"common": {
-			"common-dict.pak": 617216,
-		},
-		"sp-common": {
-			"sp-common-dict.pak": 1117024,
-		},
-		"world-abby-ellie-fight": {
-			"world-abby-ellie-fight-dict.pak": 328144,
-		},
-		"world-abby-fights-militia": {
-			"world-abby-fights-militia-dict.pak": 535872,
-		},
-		"world-abby-flashback-dad": {
-			"world-abby-flashback-dad-dict.pak": 323760,
-		},
-		"world-amputation": {
-			"world-amputation-dict.pak": 274256,
-		},
-		"world-ellie-flashback-museum": {
-			"world-ellie-flashback-museum-dict.pak": 508400,
-		},
-		"world-ellie-flashback-patrol": {
-			"world-ellie-flashback-patrol-dict.pak": 252752,
-		},
-		"world-ellie-flashback-ultimatum": {
-			"world-ellie-flashback-ultimatum-dict.pak": 198304,
-		},
-		"world-epilogue": {
-			"world-epilogue-dict.pak": 12448,
-		},
-		"world-farm": {
-			"world-farm-dict.pak": 617776,
-		},
-		"world-find-aquarium": {
-			"world-find-aquarium-dict.pak": 205712,
-		},
-		"world-find-nora": {
-			"world-find-nora-dict-1.pak": 548432,
-			"world-find-nora-dict.pak": 1065968,
-		},
-		"world-flashback-guitar": {
-			"world-flashback-guitar-dict-1.pak": 1639248,
-			"world-flashback-guitar-dict-2.pak": 148448,
-			"world-flashback-guitar-dict.pak": 1811392,
-		},
-		"world-flooded-city": {
-			"world-flooded-city-dict.pak": 1540400,
-		},
-		"world-forward-base": {
-			"world-forward-base-dict-1.pak": 858688,
-			"world-forward-base-dict.pak": 1570704,
-		},
-		"world-game-start": {
-			"world-game-start-dict.pak": 544,
-		},
-		"world-jordan-escape": {
-			"world-jordan-escape-dict.pak": 1065920,
-		},
-		"world-medicine": {
-			"world-medicine-dict-1.pak": 291872,
-			"world-medicine-dict.pak": 1281248,
-		},
-		"world-patrol": {
-			"world-patrol-dict.pak": 1046272,
-		},
-		"world-patrol-chalet": {
-			"world-patrol-chalet-dict.pak": 380128,
-		},
-		"world-patrol-departure": {
-			"world-patrol-departure-dict.pak": 259680,
-		},
-		"world-patrol-jackson": {
-			"world-patrol-jackson-dict.pak": 1737472,
-		},
-		"world-rescue-jesse": {
-			"world-rescue-jesse-dict.pak": 1281008,
-		},
-		"world-santa-barbara": {
-			"world-santa-barbara-dict.pak": 1102624,
-		},
-		"world-save-lev": {
-			"world-save-lev-dict.pak": 909840,
-		},
-		"world-saving-kids": {
-			"world-saving-kids-dict.pak": 655632,
-		},
-		"world-seattle-arrival": {
-			"world-seattle-arrival-dict.pak": 1914512,
-		},
-		"world-theater": {
-			"world-theater-dict.pak": 200752,
-		},
-		"world-theater-ambush": {
-			"world-theater-ambush-dict.pak": 138256,
-		},
-		"world-tracking": {
-			"world-tracking-dict.pak": 656848,
-		},
-		"world-tracking-horde": {
-			"world-tracking-horde-dict.pak": 257840,
-		},
-		"world-watchtower": {
-			"world-watchtower-dict-1.pak": 655024,
-			"world-watchtower-dict.pak": 1854112,
-		},
-	},
-}
-		
 DoubleClickTimer = namedtuple("DoubleClickTimer", "name idx timer")
 
 class openOptionsDialogWindow:
@@ -1208,7 +966,7 @@ class openOptionsDialogWindow:
 		global gameName
 		if self.gameIdx != self.gameBox.getSelectionIndex():
 			self.gameIdx = self.gameBox.getSelectionIndex()
-			gameName = gamesList[self.gameIdx]
+			gameName = self.pak.gameName = gamesList[self.gameIdx]
 			restOfPath = dialogOptions.currentDir.replace(self.baseDir, "")
 			self.baseDir = BaseDirectories[gameName]
 			if self.localBox.getStringForIndex(self.localIdx) == "Base Directory":
@@ -1330,7 +1088,7 @@ class openOptionsDialogWindow:
 			if self.globalScaleEditBox.getText():
 				newScale = float(self.globalScaleEditBox.getText())
 				if newScale:
-					GlobalScale = newScale
+					GlobalScale = self.pak.scale = newScale
 		except ValueError:
 			print("Non-numeric scale input, resetting to ", GlobalScale)
 			self.globalScaleEditBox.setText(str(GlobalScale))
@@ -1392,7 +1150,7 @@ class openOptionsDialogWindow:
 				self.loadBaseCheckbox.setChecked(dialogOptions.doLoadBase)
 				
 				if ReparentHelpers == 2:
-					dialogOptions.reparentHelpers = (dialogOptions.isTLOU2 or dialogOptions.isTLOUP1)
+					dialogOptions.reparentHelpers = (self.pak.isTLOU2 or self.pak.isTLOUP1)
 				index = self.noeWnd.createCheckBox("Reparent Helpers", 10, 750, 130, 20, self.checkReparentCheckbox)
 				self.reparentCheckbox = self.noeWnd.getControlByIndex(index)
 				self.reparentCheckbox.setChecked(dialogOptions.reparentHelpers)
@@ -1425,116 +1183,39 @@ class openOptionsDialogWindow:
 			
 			self.noeWnd.doModal()
 			
-TP1_pakStringIDs = {
-	0x50CAF5257D6A140B: "JOINT_HIERARCHY",
-	0x349D779A792F45C1: "GEOMETRY_1",
-	0xCE3ADE693131B309: "VRAM_DESC",
-	0xE7254422A7A8F476: "VRAM_DESC_TABLE",
-	0xA2481DA1A5D2CE2B: "TEXTURE_TABLE",
-	0x36125D3CFB7F3991: "TEXTURE_DICTIONARY",
-	0x4903731234F1BEA6: "PAK_LOGIN_TABLE",
-	0x61DE7E6141BC6F2B: "EFFECT_TABLE",
-	0x460F497540A29F73: "SPAWNER_GROUP",
-	0x596A72779C4C87D: "TAG_INT",
-	0x53DE1E1977F9CBA4: "ANIM_GROUP",
-	0x791137002DB17EBB: "MATERIAL_TABLE_1",
-	0x384ADF724B123839: "FOREGROUND_SECTION_2",
-	0x5ADB4A2D2E2A6EB: "COLLISION_DATA_CLOTH",
-	0x3A3BB43D817C93DE: "TAG_VEC4",
-	0x35EB8812D3A2D576: "TAG_FLOAT",
-	0x6A98005088A56C5: "LEVEL_BOUNDING_BOX_DATA",
-	0x438E1B0DBFFAA93: "AMBSHADOWS_OCCLUDER_INFO",
-	0x7D9BFD5CEC879080: "COLLISION_DATA_FOREGROUND",
-	0xEC3AFEDF7EF282F0: "SOUND_BANK_TABLE",
-}
-
-LODSubmeshDesc = namedtuple("LODSubmeshDesc", "name address offset index")
-
-JointsInfo = namedtuple("JointsInfo", "transformsStart parentingStart")
-
-StreamDesc = namedtuple("StreamDesc", "type offset stride bufferOffsetAddr")
-
-T2StreamDesc = namedtuple("T2StreamDesc", "type offset stride bufferOffsetAddr sizes qScale qOffs numVerts")
-
-SkinDesc = namedtuple("SkinDesc", "mapOffset weightsOffset weightCount mapOffsetAddr weightOffsetAddr uncompressed")
-
-PakEntry = namedtuple("PakEntry", "type offset")
-
-PakLoginTableEntry = namedtuple("PakLoginTableEntry", "page offset")
-
-class PakSubmesh:
-	def __init__(self, name=None, numVerts=None, numIndices=None, facesOffset=None, streamDescs=None, skinDesc=None, nrmRecalcDesc=None, streamsAddr=None, facesOffsetAddr=None, offset=None):
-		self.name = name
-		self.numVerts = numVerts
-		self.numIndices = numIndices
-		self.streamDescs = streamDescs
-		self.skinDesc = skinDesc
-		self.nrmRecalcDesc = nrmRecalcDesc
-		self.facesOffset = facesOffset
-		self.facesOffsetAddr = facesOffsetAddr
-		self.bbox = []
-		self.offset = offset
-
-class PakFile:
+class PakFile(PakReader):
 	def __init__(self, bs, args={}):
-		self.bs = bs
-		self.pakPageEntries = []
-		self.pointerPageIds = {}
-		self.entriesList = []
-		self.submeshes = []
+		PakReader.__init__(self, bs, dict(args, options=args.get("options") or dialogOptions))
 		self.args = args
-		self.path = args.get("path")
 		self.texList = args.get("texList") or []
 		self.matList = args.get("matList") or []
 		self.matNames = args.get("matNames") or []
 		self.vramHashes = args.get("vramHashes") or []
 		self.userStreams = args.get("userStreams") or {}
-		self.pakLoginTable = []
-		self.lods = args.get("lods") or []
-		self.xforms = {}
-		self.jointsInfo = None
-		self.jointOffset = None
+		self.instanceBones = args.get("instanceBones") or []
+		self.instanceMeshes = args.get("instanceMeshes") or {} #name of a shared instanced mesh: the instance bone it is weighted to
+		#per-load settings, so a pak never depends on globals that another load may change
+		self.gameName = args.get("gameName") or gameName
+		self.scale = args.get("scale") or GlobalScale
+		self.baseSkeleton = args.get("baseSkeleton") #None follows the dialog's choice, "" loads none
 		self.basePak = None
-		self.geoOffset = None
 		self.boneList = None
 		self.boneMap = None
 		self.boneDict = None
 		self.doLODs = False
-		self.needsBasePak = False
 		if args.get("doRead"):
 			self.readPak()
-		
-	def getPointerFixupPage(self, readAddr):
-		try:
-			return self.pointerPageIds[readAddr][0]
-		except:
-			return None
-		
-	def changePointerFixup(self, address, newOffset, newPage):
-		if address in self.pointerPageIds:
-			returnAddr = self.bs.tell()
-			writeUIntAt(self.bs, address, newOffset+20)
-			self.bs.seek(self.pointerPageIds[address][1])
-			self.bs.writeUShort(newPage)
-			self.bs.seek(returnAddr)
-		
-	def readPointerFixup(self, TP1ZeroCondition=False):
-		bs = self.bs
-		readAddr = bs.tell()
-		offset = bs.readInt64()
-		if offset > 0 or TP1ZeroCondition:
-			pageId = self.getPointerFixupPage(readAddr)
-			if pageId != None:
-				return offset + self.pakPageEntries[pageId][0]
-			if not TP1ZeroCondition:
-				print("ReadAddr not found in PointerFixups!", readAddr)
-				print("ReadAddr not found in PointerFixups! This file may be broken", crashHere)
-			
-		return offset
+	
+	#Closes the mapped pak files of this pak and its base skeleton pak, so Windows does not keep them locked until Noesis exits
+	def closeStreams(self):
+		if self.basePak:
+			self.basePak.closeStreams()
+		if isinstance(self.bs, PakStream):
+			self.bs.close()
 	
 	def loadBaseSkeleton(self, skelPath):
 		if skelPath and rapi.checkFileExists(skelPath):
-			self.basePak = PakFile(NoeBitStream(rapi.loadIntoByteArray(skelPath)), {'path':skelPath})
+			self.basePak = PakFile(PakStream.fromFile(skelPath), {'path':skelPath, 'gameName':self.gameName, 'scale':self.scale, 'baseSkeleton':""})
 			self.basePak.readPak()
 			self.boneList = self.basePak.boneList
 			self.boneMap = self.basePak.boneMap
@@ -1545,59 +1226,76 @@ class PakFile:
 			#print(asdf + asd)
 			return 0
 	
-	def makeVramHashJson(self, jsons):
-		fileName = rapi.getLocalFileName(self.path)
-		jsons[fileName] = {}
-		for hash, subTuple in self.vrams.items():
-			jsons[fileName][hash] = subTuple[0]
-			
+	#Rescans the game's texture dicts into NDTextureHashes.json and NDTextureHashes.bin. Dicts whose size and mtime match NDTextureDictStamps.json are kept as they are
 	def dumpGlobalVramHashes(self):
-		output = ""
+		jsonPath = noesis.getPluginsPath() + "python\\NDTextureHashes.json"
+		stampsPath = noesis.getPluginsPath() + "python\\NDTextureDictStamps.json"
 		try:
-			jsons = json.load(open(noesis.getPluginsPath() + "python\\NDTextureHashes.json"))
+			jsons = json.load(open(jsonPath))
 		except:
 			jsons = {}
-		jsons[gameName] = jsons.get(gameName) or {}
-		if gameName == "TLOU2" or gameName == "TLOUP1":
-			gameDir = BaseDirectories[gameName]
+		try:
+			stamps = json.load(open(stampsPath))
+		except:
+			stamps = {}
+		hasWorlds = self.gameName == "TLOU2" or self.gameName == "TLOUP1"
+		gameStamps = stamps.get(self.gameName) or {}
+		
+		dictFolders = {}
+		if hasWorlds:
+			gameDir = BaseDirectories[self.gameName]
 			for folderName in os.listdir(gameDir+"\\"):
-				if os.path.isdir(os.path.join(gameDir, folderName)) and os.path.isdir(os.path.join(gameDir, folderName + "\\texturedict3")):
-					root = os.path.join(gameDir, folderName + "\\texturedict3\\")
-					jsons[gameName][folderName] = jsons[gameName].get(folderName) or {} 
-					suboutput = ""
-					for fileName in os.listdir(root):
-						if fileName.find("-dict")  != -1 and fileName not in jsons[gameName][folderName]:
-							print("Found file", root + fileName)
-							dictPak = PakFile(NoeBitStream(rapi.loadIntoByteArray(root + fileName)), {"path": root + fileName})
-							pageCt = readUIntAt(dictPak.bs, 16)
-							dictPak.bs.seek(readUIntAt(dictPak.bs, 20)+12*(pageCt-1))
-							rawDataAddr = dictPak.bs.readUInt() + dictPak.bs.readUInt()
-							gdRawDataStarts[gameName][folderName] = gdRawDataStarts[gameName].get(folderName) or {}
-							gdRawDataStarts[gameName][folderName][fileName] = rawDataAddr
-							suboutput += "\n    \"" + fileName + "\": " + str(rawDataAddr) + "," 
-							dictPak.readPakHeader()
-							dictPak.makeVramHashJson(jsons[gameName][folderName])
-							with open(noesis.getPluginsPath() + "python\\NDTextureHashes.json", "w") as outfile:
-								json.dump(jsons, outfile)
-					
-					output += "\n\"" + folderName + "\": {" + suboutput + "\n},"
-			print("\nGlobal dict start offsets:\n", output)
+				if os.path.isdir(os.path.join(gameDir, folderName + "\\texturedict3")):
+					dictFolders[folderName] = os.path.join(gameDir, folderName + "\\texturedict3\\")
 		else:
-			root = os.path.dirname(dialogOptions.dialog.localDir[:-1])+"\\textureDict2\\"
-			print("Dumping textures json...")
+			dictFolders["All"] = os.path.dirname(dialogOptions.dialog.localDir[:-1])+"\\textureDict2\\"
+		
+		newDicts = {}
+		newStamps = {}
+		toScan = []
+		for worldName, root in dictFolders.items():
+			oldDicts = (jsons.get(self.gameName) or {}).get(worldName) if hasWorlds else jsons.get(self.gameName)
+			oldStamps = gameStamps.get(worldName) or {}
+			newDicts[worldName] = {}
+			newStamps[worldName] = {}
 			for fileName in os.listdir(root):
-				if fileName.find("global-dict")  != -1 and fileName not in jsons:
-					dictPak = PakFile(NoeBitStream(rapi.loadIntoByteArray(root + fileName)), {"path": root + fileName})
-					pageCt = readUIntAt(dictPak.bs, 16)
-					dictPak.bs.seek(readUIntAt(dictPak.bs, 20)+12*(pageCt-1))
-					rawDataAddr = dictPak.bs.readUInt() + dictPak.bs.readUInt()
-					gdRawDataStarts[gameName][fileName] = rawDataAddr
-					output = output + "\n\"" + fileName, ": " + str(rawDataAddr) + "," 
-					dictPak.readPakHeader()
-					dictPak.makeVramHashJson(jsons)
-					with open(noesis.getPluginsPath() + "python\\NDTextureHashes.json", "w") as outfile:
-						json.dump(jsons, outfile)
-			print("Texture Dict Start Offsets:\n", output, "\n")
+				if fileName.find("-dict" if hasWorlds else "global-dict") == -1:
+					continue
+				stat = os.stat(root + fileName)
+				oldStamp = oldStamps.get(fileName)
+				#dicts dumped before stamps were kept are trusted, like before. Dicts dumped without VRAM descs are rescanned
+				if oldDicts and fileName in oldDicts and (oldStamp is None or oldStamp[:2] == [stat.st_size, stat.st_mtime_ns]) and isinstance(next(iter(oldDicts[fileName].values()), []), list):
+					newDicts[worldName][fileName] = oldDicts[fileName]
+					newStamps[worldName][fileName] = [stat.st_size, stat.st_mtime_ns, oldStamp[2] if oldStamp else None]
+				else:
+					toScan.append((worldName, fileName))
+		
+		print("Scanning", len(toScan), "texture dicts,", sum(len(worldDicts) for worldDicts in newDicts.values()), "unchanged")
+		scans = [scanTextureDict(dictFolders[worldName] + fileName) for worldName, fileName in toScan]
+		for (worldName, fileName), scan in zip(toScan, scans):
+			if scan:
+				newDicts[worldName][fileName] = scan.hashes
+				newStamps[worldName][fileName] = [scan.size, scan.mtime, scan.rawDataStart]
+		
+		for fileName in [name for name in jsons if name.endswith(".pak")]:
+			del jsons[fileName] #U4/TLL dicts that older dumps put at the top level
+		jsons[self.gameName] = newDicts if hasWorlds else newDicts["All"]
+		stamps[self.gameName] = newStamps
+		with open(jsonPath, "w") as outfile:
+			json.dump(jsons, outfile)
+		with open(stampsPath, "w") as outfile:
+			json.dump(stamps, outfile)
+		
+		#rewrite NDTextureHashes.bin from the new hashes and reopen it
+		if dialogOptions.texDB:
+			dialogOptions.texDB.close()
+		dialogOptions.texDB = dialogOptions.texIndexes = None
+		try:
+			rawDataStarts = dict((gameName, dict((worldName, dict((fileName, stamp[2]) for fileName, stamp in worldStamps.items())) for worldName, worldStamps in gameStamps.items())) for gameName, gameStamps in stamps.items())
+			writeTextureHashDB(noesis.getPluginsPath() + "python\\NDTextureHashes.bin", TextureHashIndex.fromHashJson(jsons, rawDataStarts))
+		except Exception as e:
+			print("Failed to write NDTextureHashes.bin", e)
+		self.loadTexDict()
 	
 	def writeVRAMImage(self, vramOffset, filepath):
 		
@@ -1608,7 +1306,7 @@ class PakFile:
 			vramSize = readUIntAt(bs, vramOffset+48)
 			imgFormat = readUIntAt(bs, vramOffset+72)
 			fmtName = dxFormat.get(imgFormat) or ""
-			rawDataStart = self.pakPageEntries[len(self.pakPageEntries)-1][0] + self.pakPageEntries[len(self.pakPageEntries)-1][1]
+			rawDataStart = self.getRawDataStart()
 			newDataOffset = offset + rawDataStart
 			
 			ds = NoeBitStream(rapi.loadIntoByteArray(filepath))
@@ -1638,7 +1336,7 @@ class PakFile:
 					ds.seek(16, 1) #skip DX10 header
 				imgBytes = ds.readBytes(ds.getSize() - ds.tell())
 				
-			if dialogOptions.isTLOU2:
+			if self.isTLOU2:
 				imgBytes = rapi.callExtensionMethod("tile_1dthin", imgBytes, width, height, 4 if (fmtName.count("Bc1") or fmtName.count("Bc4")) else 8, 1)
 				if noesis.optWasInvoked("-t"):
 					numMips = 1
@@ -1692,72 +1390,54 @@ class PakFile:
 
 		
 		bs = self.bs
-		vramOffset = vramOffset or bs.tell()
-		bs.seek(vramOffset + 40)
-		pakOffset = bs.readUInt()
-		unknown0 = bs.readUInt()
-		vramSize = bs.readUInt()
-		textureDictId = bs.readUInt()
-		m_hash = bs.readUInt64()
-		unknown1 = bs.readUInt()
-		m_type = bs.readUInt()
-		imgFormat = bs.readUInt()
-		field_2C = bs.readUInt()
-		m_mipCount = bs.readUInt()
-		width = bs.readUInt()
-		height = bs.readUInt()
-		field_3C = bs.readUInt()
-		m_streamFlags = bs.readUInt()
-		texFileName = self.vrams[m_hash][1]
-		texPath = readStringAt(bs, bs.tell()+12)
+		vramDesc = self.readVramDesc(vramOffset)
+		pakOffset = vramDesc.pakOffset
+		vramSize = vramDesc.vramSize
+		m_hash = vramDesc.hash
+		imgFormat = vramDesc.imgFormat
+		width = vramDesc.width
+		height = vramDesc.height
+		texFileName = self.vrams[m_hash].name
 		
 		bigVramOffset = None
 		bigVramDictFile = ""
-		worldName = "All"
-		
-		if gameName == "TLOU2" or gameName == "TLOUP1":
-			for worldFolderName, worldDict in self.texDict.items():
-				for fileName, subDict in worldDict.items(): 
-					bigVramOffset = subDict.get(str(m_hash))
-					if bigVramOffset: 
-						if rapi.checkFileExists(BaseDirectories[gameName] + worldFolderName + "\\texturedict3\\" + fileName):
-							bigVramDictFile = BaseDirectories[gameName] + worldFolderName + "\\texturedict3\\" + fileName
-							worldName = worldFolderName
-							break
-						else:
-							bigVramOffset = None
-							print("Texture hash was found, but Texture Dict does not exist!\n	", BaseDirectories[gameName] + worldFolderName + "\\texturedict3\\" + fileName)
-				if bigVramOffset: break
-		else:
-			for fileName, subDict in self.texDict.items():
-				bigVramOffset = subDict.get(str(m_hash))
-				if bigVramOffset: 
-					if rapi.checkFileExists(BaseDirectories[gameName] + "texturedict2\\" + fileName):
-						bigVramDictFile = BaseDirectories[gameName] + "texturedict2\\" + fileName
-						break
-					else:
-						bigVramOffset = None
-						print("Texture hash was found, but Texture Dict does not exist!", texFileName, "\n	", BaseDirectories[gameName] + "texturedict2\\" + fileName)
+		
+		for location in self.texIndex.find(m_hash):
+			if location.world == "All":
+				dictPath = BaseDirectories[self.gameName] + "texturedict2\\" + location.dictFile
+			else:
+				dictPath = BaseDirectories[self.gameName] + location.world + "\\texturedict3\\" + location.dictFile
+			if rapi.checkFileExists(dictPath):
+				bigVramOffset = location.offset
+				bigVramDictFile = dictPath
+				fileName = location.dictFile
+				rawDataStart = self.texIndex.getRawDataStart(location, dictPath)
+				dictVram = location.vram
+				break
+			print("Texture hash was found, but Texture Dict does not exist!", texFileName, "\n	", dictPath)
 		
 		if bigVramOffset: 
-			vramBytes = readFileBytes(bigVramDictFile, bigVramOffset, 1024)
-			vramStream = NoeBitStream(vramBytes)
-			offset = readUIntAt(vramStream, 40)
-			width = readUIntAt(vramStream, 84)
-			height = readUIntAt(vramStream, 88)
-			vramSize = readUIntAt(vramStream, 48)
-			imgFormat = readUIntAt(vramStream, 72)
-			print("VRAM texture hash found!", fileName, '{:02X}'.format(m_hash), texFileName) #offset + gdRawDataStarts[gameName][worldName][fileName], width, height, vramSize, imgFormat, "\n", texFileName)
-			imageData = readFileBytes(bigVramDictFile, offset + gdRawDataStarts[gameName][worldName][fileName], vramSize)
+			if dictVram:
+				offset, vramSize, width, height, imgFormat = dictVram
+			else:
+				vramBytes = dialogOptions.dictFiles.read(bigVramDictFile, bigVramOffset, 1024)
+				vramStream = NoeBitStream(vramBytes)
+				offset = readUIntAt(vramStream, 40)
+				width = readUIntAt(vramStream, 84)
+				height = readUIntAt(vramStream, 88)
+				vramSize = readUIntAt(vramStream, 48)
+				imgFormat = readUIntAt(vramStream, 72)
+			print("VRAM texture hash found!", fileName, '{:02X}'.format(m_hash), texFileName) #offset + rawDataStart, width, height, vramSize, imgFormat, "\n", texFileName)
+			imageData = dialogOptions.dictFiles.read(bigVramDictFile, offset + rawDataStart, vramSize)
 		else:
 			print("Loading local texture", texFileName)
-			bs.seek(pakOffset + self.pakPageEntries[len(self.pakPageEntries)-1][0] + self.pakPageEntries[len(self.pakPageEntries)-1][1])
+			bs.seek(pakOffset + self.getRawDataStart())
 			imageData = bs.readBytes(vramSize)
 			
 		fmtName = dxFormat.get(imgFormat) or ""
 		bpp = 4 if (fmtName.count("Bc1") or fmtName.count("Bc4")) else 8
 		
-		if dialogOptions.isTLOU2:
+		if self.isTLOU2:
 			imageData = rapi.callExtensionMethod("untile_1dthin", imageData, width, height, bpp, 1)
 		
 		decodeFmt, encodeFmt, bpp = getDXTFormat(fmtName)
@@ -1783,886 +1463,415 @@ class PakFile:
 			
 		return NoeTexture(texFileName, width, height, texData, noesis.NOESISTEX_RGBA32)
 	
-	def checkResItem(self, start, m_resItemOffset, m_itemType):
-		bs = self.bs
-		self.entriesList.append(PakEntry(type=m_itemType, offset = m_resItemOffset))
-		
-		if m_itemType == "VRAM_DESC":
-			if dialogOptions.isTLOU2:
-				m_resItemOffset += 16
-			bs.seek(m_resItemOffset + start + 56)
-			texHash = bs.readUInt64()
-			texPath = readStringAt(bs, m_resItemOffset + start + 112)
-			delimiter = ".exr/" if ".exr/" in texPath else ".tga/"
-			splitted = rapi.getLocalFileName(texPath.replace(delimiter, "+")).split("+", 1)
-			texName = splitted[0] + texoutExt
-			if len(splitted) > 1:
-				if texName in self.vramNames:
-					texName = (splitted[0] + "_" + splitted[1]).replace(".ndb", texoutExt) #add hash to duplicate texture names
-				self.vramNames[texName] = True
-				self.vrams[texHash] = [m_resItemOffset + start, texName, [], None]
-		
-		if m_itemType == "JOINT_HIERARCHY":
-			self.jointOffset = (m_resItemOffset, start)
-			
-		if m_itemType == "GEOMETRY_1":
-			self.geoOffset = (m_resItemOffset, start)
-			m_numSubMeshDesc = readUIntAt(bs, self.geoOffset[0] + self.geoOffset[1] + ResItemPaddingSz + 8)
-			bs.seek(self.geoOffset[0] + self.geoOffset[1] + ResItemPaddingSz + 40)
-			SubmeshesOffs = self.readPointerFixup()
-			for i in range(m_numSubMeshDesc):
-				bs.seek(SubmeshesOffs + 176*i + 104)
-				self.needsBasePak = self.needsBasePak or not not bs.readUInt64()
+	def readPakHeader(self, itemTypes=None):
 	
-	def readPakHeader(self):
-	
-		global dialogOptions, ResItemPaddingSz
-		
-		print ("Reading", self.path or rapi.getInputName())
-		readPointerFixup = self.readPointerFixup
+		global dialogOptions
 		
-		bs = self.bs
-		bs.seek(0)
-		m_magic = bs.readUInt()						#0x0 0x00000A79
-		if m_magic != 2681 and m_magic != 68217 and m_magic != 2147486329 and m_magic != 2685 and m_magic != 68221:
-			print("No pak header detected!", m_magic)
+		if not PakReader.readPakHeader(self, itemTypes):
 			return 0
-		dialogOptions.isTLOUP1 = (m_magic == 2685 or m_magic == 68221)
-		
-		m_hdrSize = bs.readUInt()					#0x4 header size
-		m_pakLoginTableIdx = bs.readUInt()			#0x8 idx of the page storing the PakLoginTable
-		m_pakLoginTableOffset = bs.readUInt()		#0xC relative offset PakLoginTable = PakPageHeader + m_pakLoginTableOffset; //its a ResItem
-		m_pageCt = bs.readUInt()					#0x10 page count. Total number of pages in the package
-		m_pPakPageEntryTable = bs.readUInt()		#0x14 ptr to the PakPageEntry array/table
-		m_numPointerFixUpPages = bs.readUInt()		#0x18 always 0x8
-		m_pointerFixUpTableOffset = bs.readUInt()	#0x1C ptr to the PointerFixUpTable table
-		m_unk5 = bs.readUInt()						#0x20 no idea
-		m_unk6 = bs.readUInt()						#0x20 no idea
-		m_unk7 = bs.readUInt()						#0x20 no idea
-		if dialogOptions.isTLOUP1:
-			m_unk8 = bs.readUInt()
-			m_unk9 = bs.readUInt()
-			m_unk10 = bs.readUInt()
-			
-		bs.seek(m_pPakPageEntryTable)
-		self.pakPageEntries = []
-		for i in range(m_pageCt):
-			self.pakPageEntries.append((bs.readUInt(), bs.readUInt(), bs.readUInt()))
-		
-		bs.seek(m_pointerFixUpTableOffset)
-		m_pageEntryNumber = bs.readUInt()
-		m_dataOffset = bs.readUInt()
-		m_numLoginPageEntries = bs.readUInt()
-		bs.seek(m_dataOffset)
-		
-		self.pointerPageIds = {}
-		for i in range(m_numLoginPageEntries):
-			m_page1Idx = bs.readUShort()
-			m_page2Idx = bs.readUShort()
-			pointerOffs = bs.readUInt()
-			self.pointerPageIds[pointerOffs + self.pakPageEntries[m_page1Idx][0]] = (m_page2Idx, bs.tell()-6)
-			
-		self.jointOffset = self.geoOffset = None
-		self.vrams = {}
 		
-		if rapi.checkFileExists(noesis.getPluginsPath() + "python\\NDTextureHashes.json"):
-			file = open(noesis.getPluginsPath() + "python\\NDTextureHashes.json")
-			dialogOptions.texDicts = dialogOptions.texDicts or json.load(file)
-		else:
-			dialogOptions.texDicts = {}
+		self.loadTexDict()
+		return 1
+	
+	def loadTexDict(self):
 		
-		for name in gamesList:
-			dialogOptions.texDicts[name] = dialogOptions.texDicts.get(name) or {}
-		self.texDict = dialogOptions.texDicts[gameName]
-
-		self.pakLoginTable = []
-		self.vramNames = {}
-		
-		pakLoginTableItemStart = self.pakPageEntries[m_pakLoginTableIdx][0] + m_pakLoginTableOffset
-		dialogOptions.isTLOU2 = (readUIntAt(bs, pakLoginTableItemStart+32) == 74565)
-		ResItemPaddingSz = 48 if (dialogOptions.isTLOU2 or dialogOptions.isTLOUP1) else 32
-		bs.seek(pakLoginTableItemStart + ResItemPaddingSz)
-		loginCount = bs.readUInt()
-		bs.seek(4, 1)
-		
-		for i in range(loginCount):
-			self.pakLoginTable.append(PakLoginTableEntry(page=bs.readUInt(), offset=bs.readUInt()))
-		
-		if dialogOptions.isTLOUP1: #the outer pak format was changed a lot for TLOU Part I. ResPage and ResPageEntry are gone, now all ResItems are accessed from the pak login table and have StringIDs for names
-			for loginResItem in self.pakLoginTable:
-				start = self.pakPageEntries[loginResItem.page][0]
-				bs.seek(start + loginResItem.offset + 32)
-				typeStringID = bs.readUInt64()
-				m_itemType = TP1_pakStringIDs.get(typeStringID)
-				if m_itemType:
-					self.checkResItem(start, loginResItem.offset, m_itemType)
-					if m_itemType == "TEXTURE_TABLE" or m_itemType == "TEXTURE_DICTIONARY":
-						numTex = readUIntAt(bs, start + loginResItem.offset + ResItemPaddingSz)
-						bs.seek(start + loginResItem.offset + ResItemPaddingSz + 24)
-						listStart = readPointerFixup()
-						for i in range(numTex):
-							bs.seek(listStart+i*8)
-							pageID = self.getPointerFixupPage(bs.tell())
-							pointer = bs.readUInt64()
-							self.checkResItem(self.pakPageEntries[pageID][0], pointer-32, "VRAM_DESC")
-		else:
-			for p, pageEntry in enumerate(self.pakPageEntries):
-				start = pageEntry[0]
-				bs.seek(start + 12)
-				m_pageSize = bs.readUInt()
-				bs.seek(2,1)
-				m_numPageHeaderEntries = bs.readUShort()
-				
-				for ph in range(m_numPageHeaderEntries):
-					m_name = readStringAt(bs, bs.readUInt64()+start)
-					m_resItemOffset = bs.readUInt()
-					place = bs.tell() + 4
-					bs.seek(m_resItemOffset + start)
-					m_itemNameOffset = bs.readUInt64()
-					m_itemName = readStringAt(bs, m_itemNameOffset+start)
-					m_itemTypeOffset = bs.readUInt64()
-					m_itemType = readStringAt(bs, m_itemTypeOffset+start)
-					self.checkResItem(start, m_resItemOffset, m_itemType)
-					bs.seek(place)
-		
-	def readPak(self):
+		global dialogOptions
+		
+		if dialogOptions.texIndexes is None:
+			dialogOptions.texIndexes = {}
+			jsonPath = noesis.getPluginsPath() + "python\\NDTextureHashes.json"
+			dbPath = noesis.getPluginsPath() + "python\\NDTextureHashes.bin"
+			hasJson = rapi.checkFileExists(jsonPath)
+			#NDTextureHashes.bin is converted from the json whenever the json is newer, or the .bin is from an older version
+			needsConvert = hasJson and (not rapi.checkFileExists(dbPath) or os.path.getmtime(dbPath) < os.path.getmtime(jsonPath))
+			if not needsConvert and rapi.checkFileExists(dbPath):
+				try:
+					dialogOptions.texDB = TextureHashDB.open(dbPath)
+				except Exception as e:
+					print("Failed to read", dbPath, e)
+					needsConvert = hasJson
+			if needsConvert:
+				print("Converting NDTextureHashes.json to", dbPath)
+				try:
+					convertTextureHashJson(jsonPath, dbPath)
+					dialogOptions.texDB = TextureHashDB.open(dbPath)
+				except Exception as e:
+					print("Failed to write", dbPath, e)
+					dialogOptions.texIndexes = TextureHashIndex.fromHashJson(json.load(open(jsonPath)))
+			if dialogOptions.texDB:
+				dialogOptions.texIndexes = dialogOptions.texDB.games
+		self.texIndex = dialogOptions.texIndexes.get(self.gameName) or TextureHashIndex()
+		
+	#lods as in PakReader.readPak. parsed: the core parse already ran (see parseMergePak), only finish the Noesis side
+	def readPak(self, lods=None, parsed=False):
 		
 		global dialogOptions
-		bs = self.bs
-		readPointerFixup = self.readPointerFixup
 		
-		if len(self.pakPageEntries) == 0:
+		if parsed:
+			self.loadTexDict()
+		elif len(self.pakPageEntries) == 0:
 			self.readPakHeader()
-		start = self.pakPageEntries[0]
 		
-		if not self.jointOffset and dialogOptions.doLoadBase and dialogOptions.baseSkeleton: # and dialogOptions.baseIdx != -1:
+		baseSkeleton = dialogOptions.baseSkeleton if self.baseSkeleton is None else self.baseSkeleton
+		if not self.jointOffset and dialogOptions.doLoadBase and baseSkeleton: # and dialogOptions.baseIdx != -1:
 			localRoot = findRootDir(rapi.getOutputName() or rapi.getInputName())
-			baseSkelPath = BaseDirectories[gameName] + dialogOptions.baseSkeleton if dialogOptions.baseSkeleton[1] != ":" else dialogOptions.baseSkeleton
-			if rapi.checkFileExists(localRoot + dialogOptions.baseSkeleton):
-				baseSkelPath = localRoot + dialogOptions.baseSkeleton
+			baseSkelPath = BaseDirectories[self.gameName] + baseSkeleton if baseSkeleton[1] != ":" else baseSkeleton
+			if rapi.checkFileExists(localRoot + baseSkeleton):
+				baseSkelPath = localRoot + baseSkeleton
 				if rapi.checkFileExists(baseSkelPath.replace(".pak", ".NEW.pak")): 
 					baseSkelPath = baseSkelPath.replace(".pak", ".NEW.pak")
 				print("\nFound local base pak: ", baseSkelPath, "\n")
-			dialogOptions.baseSkeleton = ""
+			dialogOptions.baseSkeleton = self.baseSkeleton = ""
 			if not self.loadBaseSkeleton(baseSkelPath) and not noesis.optWasInvoked("-t"):
 				return 0
 		
-		if self.jointOffset:
-			start = self.jointOffset[1]
-			print("Found Joint Hierarchy") # offset", self.jointOffset[0] + start, ", location:", self.jointOffset[0] + start + 20 + 32)
-			bs.seek(self.jointOffset[0] + start + 20 + ResItemPaddingSz)
-			boneCount = bs.readUInt()
-			bs.seek(8,1)
-			xformsOffset = readPointerFixup()
-			flagsOffset = bs.readUInt64()
-			uknOffset = bs.readUInt64()
-			namesOffset = readPointerFixup()
-			
-			bs.seek(xformsOffset + 16)
-			nodeCount = bs.readUShort()
-			xformCount = bs.readUShort()
-			uknCount = bs.readUShort()
-			uknShort = bs.readUShort()
-			uknHash0 = bs.readUInt()
-			uknHash1 = bs.readUInt()
-			headerSize = bs.readUInt()
-			uknInt0 = bs.readUInt()
-			uknInt1 = bs.readUInt()
-			aOffs = bs.readUInt()
-			bOffs = bs.readUInt()
-			cOffs = bs.readUInt()
-			uknInt2 = bs.readUInt()
-			hierarchyOffset = bs.readUInt()
-			
-			self.boneList = self.boneList or []
-			parentList = []
-			matrixList = []
-			
-			transformsStart = xformsOffset + headerSize
-			bs.seek(transformsStart)
-			for b in range(xformCount):
-				scale = NoeVec3((bs.readFloat(), bs.readFloat(), bs.readFloat()))
-				bs.seek(4,1)
-				rotation = NoeQuat((bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat())).transpose()
-				position = NoeVec3((bs.readFloat(), bs.readFloat(), bs.readFloat()))
-				bs.seek(4,1)
-				mat = rotation.toMat43()
-				mat[3] = position * GlobalScale
-				matrixList.append(mat)
-				
-			bs.seek(xformsOffset + hierarchyOffset + 20)
-			hashesSize = bs.readUInt()
-			bs.seek(hashesSize - 24, 1)
-			parentingStart = bs.tell()
-			for b in range(boneCount):
-				parentList.append((bs.readInt(), bs.readInt(), bs.readInt(), bs.readInt())) #GroupID, ParentID, ChildID, ChainID
-			
-			self.jointsInfo = JointsInfo(transformsStart=transformsStart, parentingStart=parentingStart)
-			
-			
-			mainBoneMats = []
-			boneNames = []
-			self.boneDict = []
-			self.boneMap = []
-			oldBoneNames = [bone.name for bone in self.boneList]
-			
-			bs.seek(namesOffset)
-			for b in range(boneCount):
-				bs.seek(8,1)
-				boneNames.append(readStringAt(bs, bs.readUInt64()+start))
-				
-			def getRootParent(parentTbl):
-				while parentTbl[1] != -1:
-					parentTbl = parentList[parentTbl[1]]
-				return parentList.index(parentTbl)
-			
-			for b in range(boneCount):	
-				if getRootParent(parentList[b]) == 0:
-					self.boneMap.append(b)
-				
-			identity = NoeMat43((NoeVec3((1.0, 0.0, 0.0)), NoeVec3((0.0, 1.0, 0.0)), NoeVec3((0.0, 0.0, 1.0)), NoeVec3((0.0, 0.0, 0.0))))
-			startBoneIdx = len(self.boneList)
-			for b, bID in enumerate(self.boneMap):
-				mat = matrixList[b] if b < len(matrixList) else identity
-				mainBoneMats.append(mat)
-			
-			for b in range(boneCount):
-				
-				if b in self.boneMap:
-					self.boneList.append(NoeBone(startBoneIdx + b, boneNames[b], mainBoneMats[self.boneMap.index(b)], None, parentList[b][1]))
-				else:
-					splitted = boneNames[b].split("_")
-					endName = splitted[len(splitted)-1]
-					matchedName = boneNames[b].replace("_" + endName, "")#.replace("_runtime", "")
-					bFound = False
-					mat = identity
-					if parentList[b][3] != -1 and parentList[b][3] in self.boneMap: #parentList[b][3] < len(self.boneMap) and self.boneMap[parentList[b][3]] < len(mainBoneMats):
-						mat = mainBoneMats[self.boneMap[parentList[b][3]]]
-					for j, bId in enumerate(self.boneMap):
-						if boneNames[bId].find(matchedName) != -1:
-							bFound = True
-							self.boneList.append(NoeBone(startBoneIdx + b, boneNames[b], mat, None, parentList[b][1]))
-							if parentList[b][1] == -1 or (dialogOptions.reparentHelpers and (endName == "helper" or endName == "grp")): # or endName == "mover"
-								self.boneList[len(self.boneList)-1].parentIndex = bId
-							break
-					if not bFound:
-						self.boneList.append(NoeBone(startBoneIdx + b, boneNames[b], mat, None, parentList[b][1]))
-				lastBone = self.boneList[len(self.boneList)-1]
-				if lastBone.parentIndex != -1:
-					lastBone.parentIndex += startBoneIdx
-				elif b not in self.boneMap:
-					if lastBone.name == "eyelash_grp" and "headb" in boneNames:
-						lastBone.parentIndex = boneNames.index("headb") + startBoneIdx
-					else:	
-						lastBone.parentIndex = 0 #parent stragglers to root
-						
-		if self.geoOffset:
-			start = self.geoOffset[1]
-			print("Found Geometry") # offset", self.geoOffset[0] + start)
-			
-			lastLOD = 0
-			self.submeshes = []
+		if not parsed:
+			PakReader.readPak(self, lods)
+		
+		if self.joints:
+			self.buildBones()
+		if self.submeshes:
+			self.buildMaterials()
+		return 1
+		
+	def buildBones(self):
+		
+		boneNames = self.joints.names
+		parentList = self.joints.parents
+		boneCount = len(boneNames)
+		
+		self.boneList = self.boneList or []
+		matrixList = []
+		for scale, rotation, position in self.joints.transforms:
+			mat = NoeQuat(rotation).transpose().toMat43()
+			mat[3] = NoeVec3(position) * self.scale
+			matrixList.append(mat)
+		
+		mainBoneMats = []
+		self.boneDict = []
+		self.boneMap = []
 			
-			bs.seek(self.geoOffset[0] + start + ResItemPaddingSz)
+		def getRootParent(parentTbl):
+			while parentTbl[1] != -1:
+				parentTbl = parentList[parentTbl[1]]
+			return parentList.index(parentTbl)
+		
+		for b in range(boneCount):	
+			if getRootParent(parentList[b]) == 0:
+				self.boneMap.append(b)
 			
-			m_version = bs.readUInt()
-			m_isForeground = bs.readUInt()
-			m_numSubMeshDesc = bs.readUInt()
-			m_numLODs = bs.readUInt()
-			m_numMaterials = bs.readUInt()
-			m_unk4 = bs.readUInt()
-			m_numShaders = bs.readUInt()
-			m_unk6 = bs.readUInt()
-			m_unk7 = bs.readUInt()
-			m_unk8 = bs.readUInt()
-			SubmeshesOffs = readPointerFixup()
+		identity = NoeMat43((NoeVec3((1.0, 0.0, 0.0)), NoeVec3((0.0, 1.0, 0.0)), NoeVec3((0.0, 0.0, 1.0)), NoeVec3((0.0, 0.0, 0.0))))
+		startBoneIdx = len(self.boneList)
+		for b, bID in enumerate(self.boneMap):
+			mat = matrixList[b] if b < len(matrixList) else identity
+			mainBoneMats.append(mat)
+		
+		for b in range(boneCount):
 			
-			self.xforms = {}
-			if dialogOptions.isTLOU2 or dialogOptions.isTLOUP1:
-				uknStruct = readPointerFixup()
-				m_papTransform = readPointerFixup()
-				textureDescsOffs = readPointerFixup()
-				shaderDescsOffs = readPointerFixup()
-				materialDescsOffs = readPointerFixup()
-				print(m_papTransform)
+			if b in self.boneMap:
+				self.boneList.append(NoeBone(startBoneIdx + b, boneNames[b], mainBoneMats[self.boneMap.index(b)], None, parentList[b][1]))
 			else:
-				LODDescsOffs = readPointerFixup()
-				ukn0 = bs.readUInt64()
-				textureDescsOffs = readPointerFixup()
-				shaderDescsOffs = readPointerFixup()
-				ukn3 = bs.readUInt64()
-				uknFloatsOffs = readPointerFixup()
-				materialDescsOffs = readPointerFixup()
-			
-			if 'm_papTransform' in locals():
-				for i in range(m_numMaterials):
-					bs.seek(m_papTransform + 8*i)
-					offset = readPointerFixup()
-					bs.seek(offset)
-					mat = NoeMat44((NoeVec4((bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat())), NoeVec4((bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat())), NoeVec4((bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat())), NoeVec4((bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat())))).toMat43()
-					#vec4_1 = NoeQuat((bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat()))
-					#vec4_2 = NoeVec4((bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat())).toVec3()
-					#mat *= vec4_1.toMat43()
-					#mat[3] += vec4_2
-					bs.seek(offset + 152)
-					submeshXformsOffs = readPointerFixup()
-					numSubmeshXforms = readUIntAt(bs, offset+212)
-					for j in range(numSubmeshXforms):
-						bs.seek(submeshXformsOffs + j*112 + 64)
-						submeshOffs = readPointerFixup(True)
-						self.xforms[submeshOffs] = self.xforms.get(submeshOffs) or []
-						self.xforms[submeshOffs].append(mat)
-			
-			usedMaterials = {}
-			usedTextures = []
-			'''
-			for i in range(m_numLODs):
-				bs.seek(LODDescsOffs + 8*i)
-				bs.seek(readPointerFixup())
-				unknown = bs.readUInt()
-				submeshCount = bs.readUInt()
-				unknown64 = bs.readUInt64()
-				collectionName = readStringAt(bs, readPointerFixup())
-				firstSubmeshDescOffs = readPointerFixup()
-				uknBytesOffs = readPointerFixup()
-				submeshDescs = []
-				for s in range(submeshCount):
-					bs.seek(firstSubmeshDescOffs + 16*s)
-					submeshOffs = readPointerFixup()
-					submeshIdx = bs.readUInt()
-					submeshUkn = bs.readUInt()
-					bs.seek(submeshOffs + 8)
-					submeshName = readStringAt(bs, readPointerFixup()).split("|")
-					submeshName = submeshName[len(submeshName)-1]
-					submeshDescs.append(LODSubmeshDesc(name=submeshName,  address=firstSubmeshDescOffs + 16*s, offset=submeshOffs, index=submeshIdx))
-				self.lods.append(submeshDescs)
-			'''
-			for i in range(m_numSubMeshDesc):
-				bs.seek(SubmeshesOffs + 176*i)
-				if dialogOptions.isTLOU2 or dialogOptions.isTLOUP1:
-					bbox = [[bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat()], [bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat()]]
-					submeshName = readStringAt(bs, readPointerFixup() or start).split("|")
-					submeshName = submeshName[len(submeshName)-1]
-					ukn64_0 = bs.readUInt64()
-					m_pStreamDesc = readPointerFixup()
-					ukn64_1 = bs.readUInt64()
-					facesOffsetAddr = bs.tell()
-					m_pIndexes = readPointerFixup(True)
-					m_material = readPointerFixup()
-					ukn64_2 = bs.readUInt64()
-					skindataOffset = readPointerFixup()
-					ukn64_3 = bs.readUInt64()
-					ukn64_4 = bs.readUInt64()
-					nrmRecalcDescOffsOffset = bs.tell()
-					nrmRecalcDescOffs = readPointerFixup()
-					uknStringOffs = bs.readUInt64()
-					m_numVertexes = bs.readUInt()
-					m_numIndexes = bs.readUInt()
-					m_numStreamSource = bs.readUInt()
-					m_numDefaultStreams = bs.readUInt()
-					ukn32_0 = bs.readUInt()
-					ukn32_1 = bs.readUInt()
-					ukn64_5 = bs.readUInt64()
-					ukn32_2 = bs.readUInt()
-					ukn32_3 = bs.readUInt()
-					ukn32_4 = bs.readUInt()
-					ukn32_5 = bs.readUInt()
-				else:
-					field_0 = bs.readUInt()
-					field_4 = bs.readUInt()
-					submeshName = readStringAt(bs, readPointerFixup()).split("|")
-					submeshName = submeshName[len(submeshName)-1]
-					field_10 = bs.readUInt()
-					field_14 = bs.readUInt()
-					field_18 = bs.readUInt()
-					field_1C = bs.readUInt()
-					field_20 = bs.readUInt()
-					m_numVertexes = bs.readUInt()
-					m_numIndexes = bs.readUInt()
-					m_numStreamSource = bs.readUInt()
-					m_numDefaultStreams = bs.readInt()
-					field_34 = bs.readUInt()
-					m_pStreamDesc = readPointerFixup()
-					field_40 = bs.readUInt()
-					field_44 = bs.readUInt()
-					facesOffsetAddr = bs.tell()
-					m_pIndexes = readPointerFixup()
-					m_material = readPointerFixup()
-					m_numMaterialInstances = bs.readUInt()
-					field_5C = bs.readUInt()
-					field_60 = bs.readUInt()
-					field_64 = bs.readUInt()
-					skindataOffset = readPointerFixup()
-					field_70 = bs.readUInt()
-					field_74 = bs.readUInt()
-					field_78 = bs.readUInt()
-					field_7C = bs.readUInt()
-					field_80 = bs.readUInt()
-					field_84 = bs.readUInt()
-					nrmRecalcDescOffsOffset = bs.tell()
-					nrmRecalcDescOffs = readPointerFixup()
-					field_90 = bs.readUInt()
-					field_94 = bs.readUInt()
-					field_98 = bs.readUInt()
-					field_9C = bs.readUInt()
-					field_A0 = bs.readUInt()
-					field_A4 = bs.readUInt()
-					field_A8 = bs.readUInt()
-					field_AC = bs.readUInt()
-				
-				place = bs.tell()
-				streamDescs = []
-				
-				for j in range(m_numStreamSource):
-					
-					if dialogOptions.isTLOU2 or dialogOptions.isTLOUP1:
-						bs.seek(m_pStreamDesc + 64*j)
-						buffOffsAddr = bs.tell()
-						m_bufferOffset = readPointerFixup(True)
-						
-						numVerts = bs.readUInt()
-						uknInt = bs.readUInt()
-						bufferSize = bs.readUInt()
-						
-						m_compType = bs.readUByte()
-						m_unk2 = bs.readUByte()
-						m_unk3 = bs.readBits(4)
-						m_stride = bs.readBits(4)
-						m_unk4 = bs.readUByte()
-						sizes = [bs.readUByte(), bs.readUByte(), bs.readUByte(), bs.readUByte()]
-						
-						uknInt0 = bs.readUInt()
-						qScale = NoeVec4((bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat()))# * 10000
-						
-						qOffs = NoeVec4((bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat()))
-						bs.readFloat()
-						desc = T2StreamDesc(type=m_compType, offset=m_bufferOffset, stride=m_stride, bufferOffsetAddr=buffOffsAddr, sizes=sizes, qScale=qScale, qOffs=qOffs, numVerts=numVerts)
-						if desc.offset < bs.getSize():
-							streamDescs.append(desc)
-					else:
-						bs.seek(m_pStreamDesc + 24*j)
-						m_numAttributes = bs.readUByte()
-						m_unk  = bs.readUByte()
-						m_stride  = bs.readUShort()
-						m_unk2 = bs.readUByte()
-						m_unk3 = bs.readUByte()
-						m_unk4 = bs.readUShort()
-						m_compInfoOffs = readPointerFixup()
-						buffOffsAddr = bs.tell()
-						m_bufferOffset = readPointerFixup()
-						
-						bs.seek(m_compInfoOffs)
-						
-						m_unkC0 = bs.readUByte()
-						m_unkC1 = bs.readUByte()
-						m_unkC2 = bs.readUByte()
-						m_compType = bs.readUByte()
-						
-						streamDescs.append(StreamDesc(type=m_compType, offset=m_bufferOffset, stride=m_stride, bufferOffsetAddr=buffOffsAddr))
-				
-				self.submeshes.append(PakSubmesh(submeshName, m_numVertexes, m_numIndexes, m_pIndexes, streamDescs))
-				self.submeshes[i].facesOffsetAddr = facesOffsetAddr
-				self.submeshes[i].offset = SubmeshesOffs + 176*i
-				if dialogOptions.isTLOU2 or dialogOptions.isTLOUP1:
-					self.submeshes[i].bbox = bbox
-				
-				self.submeshes[i].streamsAddr = m_compInfoOffs if not dialogOptions.isTLOU2 and not dialogOptions.isTLOUP1 else None
+				splitted = boneNames[b].split("_")
+				endName = splitted[len(splitted)-1]
+				matchedName = boneNames[b].replace("_" + endName, "")#.replace("_runtime", "")
+				bFound = False
+				mat = identity
+				if parentList[b][3] != -1 and parentList[b][3] in self.boneMap: #parentList[b][3] < len(self.boneMap) and self.boneMap[parentList[b][3]] < len(mainBoneMats):
+					mat = mainBoneMats[self.boneMap[parentList[b][3]]]
+				for j, bId in enumerate(self.boneMap):
+					if boneNames[bId].find(matchedName) != -1:
+						bFound = True
+						self.boneList.append(NoeBone(startBoneIdx + b, boneNames[b], mat, None, parentList[b][1]))
+						if parentList[b][1] == -1 or (dialogOptions.reparentHelpers and (endName == "helper" or endName == "grp")): # or endName == "mover"
+							self.boneList[len(self.boneList)-1].parentIndex = bId
+						break
+				if not bFound:
+					self.boneList.append(NoeBone(startBoneIdx + b, boneNames[b], mat, None, parentList[b][1]))
+			lastBone = self.boneList[len(self.boneList)-1]
+			if lastBone.parentIndex != -1:
+				lastBone.parentIndex += startBoneIdx
+			elif b not in self.boneMap:
+				if lastBone.name == "eyelash_grp" and "headb" in boneNames:
+					lastBone.parentIndex = boneNames.index("headb") + startBoneIdx
+				else:	
+					lastBone.parentIndex = 0 #parent stragglers to root
+	
+	def buildMaterials(self):
+		
+		usedMaterials = {}
+		usedTextures = []
+		
+		for sm in self.submeshes:
+			
+			material = usedMaterials.get(sm.material) 
+			
+			if not material:
+				matDesc = self.materials[sm.material]
+				matKey = rapi.getLocalFileName(matDesc.name[:matDesc.name.find(":")])
+				rapi.setPreviewOption("autoLoadNonDiffuse", "1")
+				material = NoeMaterial(matKey, "")
+				#materialFlags = 0
+				material.setDefaultBlend(0)
+				material.setSpecularColor(NoeVec4([0.5, 0.5, 0.5, 32.0])) 
+				secondaryDiffuse = []
+				secondaryNormal = []
+				secondaryAlpha = []
+				loadedDiffuse = loadedNormal = loadedTrans = loadedSpec = loadedMetal = loadedRoughness = loadedOcc = False
 				
-				if nrmRecalcDescOffs:
-					bs.seek(nrmRecalcDescOffs)
-					indexCount = bs.readInt()
-					uknInt2 = bs.readInt()
-					ptrOffsetsStart = bs.tell()
-					ptr1 = readPointerFixup()
-					ptr2 = readPointerFixup()
-					ptr3 = readPointerFixup()
-					ptr4 = readPointerFixup()
+				for texDesc in matDesc.textures:
+					name = texDesc.name
+					vramHash = texDesc.hash
+					texFileName = self.vrams[vramHash].name if vramHash in self.vrams else ""
+					doSet = False
 					
-					self.submeshes[i].nrmRecalcDesc = [ptr1, ptr2, ptr3, ptr4, indexCount, nrmRecalcDescOffsOffset, ptrOffsetsStart]
-				
-				if skindataOffset:
-					bs.seek(skindataOffset)
-					uknSD0 = bs.readUInt()
-					numWeights = bs.readUInt()
-					uknSD2 = bs.readUInt()
-					uknSD3 = bs.readUInt()
-					bIndicesOffs = readPointerFixup(dialogOptions.isTLOUP1)
-					weightsOffs = readPointerFixup(dialogOptions.isTLOUP1)
+					if texFileName.count("missing"):
+						continue
 					
-					self.submeshes[i].skinDesc = SkinDesc(mapOffset=bIndicesOffs, weightsOffset=weightsOffs, weightCount=numWeights, mapOffsetAddr=bs.tell()-16, weightOffsetAddr=bs.tell()-8, uncompressed=(dialogOptions.isTLOUP1 and uknSD2 > 0))
+					if texFileName and name.find("01") != -1:
+						if not loadedDiffuse and name.find("BaseColor01") != -1:
+							doSet = loadedDiffuse = vramHash 
+							material.setTexture(texFileName)
+						elif not loadedNormal and (name.find("Normal01") != -1 or name.find("NR") != -1):
+							doSet = loadedNormal = vramHash
+							material.setNormalTexture(texFileName)
+							if dialogOptions.doConvertTex:
+								#if gameName != "TLOUP1":
+								material.flags |= noesis.NMATFLAG_NORMALMAP_FLIPY #| noesis.NMATFLAG_NORMALMAP_NODERZ
+								if name.find("NR") != -1 and texFileName.find("-ao") != -1: # Ambient Occlusion
+									self.vrams[vramHash].extraTextures.append(texFileName.replace(texoutExt, "_NoesisAO" + texoutExt))
+									material.setOcclTexture(self.vrams[vramHash].extraTextures[len(self.vrams[vramHash].extraTextures)-1])
+							
+						elif not loadedTrans and name.find("Transparency01") != -1:
+							doSet = loadedTrans = vramHash
+							material.setOpacityTexture(texFileName)
+							material.setAlphaTest(0.05)
+							material.flags |= noesis.NMATFLAG_TWOSIDED
+							
+							if dialogOptions.doConvertTex:
+								if not loadedNormal:
+									self.vrams[vramHash].extraTextures.append("NoesisNRM" + texoutExt)
+									material.setNormalTexture(self.vrams[vramHash].extraTextures[len(self.vrams[vramHash].extraTextures)-1])
+								if not loadedDiffuse:
+									self.vrams[vramHash].extraTextures.append("NoesisBrown" + texoutExt)
+									material.setTexture(self.vrams[vramHash].extraTextures[len(self.vrams[vramHash].extraTextures)-1])
+								
+						elif not loadedSpec and name.find("pecular") != -1:
+							doSet = loadedSpec = vramHash
+							material.setSpecularTexture(texFileName)
+							#material.flags |= noesis.NMATFLAG_PBR_SPEC
+						elif not loadedOcc and name.find("Ao01") != -1:
+							doSet = loadedOcc = vramHash
+							material.setOcclTexture(texFileName)
+							
+					if not loadedDiffuse and not secondaryDiffuse and (name.find("Color0") != -1):
+						secondaryDiffuse = [texFileName, vramHash]
+					if not loadedNormal and not secondaryNormal and name.find("Normal0") != -1: # and not (texFileName.count("tile") or texFileName.count("detail")):
+						secondaryNormal = [texFileName, vramHash]
+					if not loadedTrans and not secondaryAlpha and (name.find("Transparency0") != -1):
+						secondaryAlpha = [texFileName, vramHash]
+							
+					'''if dialogOptions.doConvertTex and not loadedSpec :
+						if  (name.find("LinearBlend0") != -1 or name.find("ME") != -1): #not loadedMetal and
+							if not loadedRoughness:
+								doSet = loadedMetal = vramHash
+								material.setSpecularTexture(texFileName)
+								material.setSpecularSwizzle( NoeMat44([[0, 0, 1, 0], [1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 1]]) )
+							elif loadedRoughness != vramHash:
+								self.vrams[loadedRoughness].extraTextures.append([vramHash, 0, 0]) #copy red channel of this texture to red channel of roughness texture (which has been set as specular)
+							else:
+								material.setRoughness(0.75, 0.0)
+							material.flags |= noesis.NMATFLAG_PBR_SPEC_IR_RG | noesis.NMATFLAG_PBR_METAL
+							material.setMetal(0.5, 0.0)
+							
+						if not loadedRoughness and (name.find("Curvature0") != -1 or name.find("RO") != -1):
+							if not loadedMetal:
+								doSet = loadedRoughness = vramHash
+								material.setSpecularTexture(texFileName)
+							elif loadedMetal != vramHash:
+								self.vrams[loadedMetal].extraTextures.append([vramHash, 0, 1])  #copy red channel of this texture to green channel of metal texture (which has been set as specular)
+							else:
+								material.setMetal(0.0, 0.0)
+							material.flags |= noesis.NMATFLAG_PBR_SPEC_IR_RG | noesis.NMATFLAG_PBR_METAL
+							material.setRoughness(0.75, 0.5)'''
+							
+					doSet = doSet or dialogOptions.loadAllTextures
 					
-				bs.seek(m_material)
-				shaderAssetNameOffs = readPointerFixup()
-				shaderTypeOffs = readPointerFixup()
+					if doSet and texFileName and texFileName not in usedTextures:
+						self.vramHashes.append(vramHash)
+						usedTextures.append(texFileName)
 				
+				if not loadedDiffuse and secondaryDiffuse:
+					loadedDiffuse = True
+					material.setTexture(secondaryDiffuse[0])
+					if secondaryDiffuse[0] not in usedTextures:
+						self.vramHashes.append(secondaryDiffuse[1])
+						usedTextures.append(secondaryDiffuse[0])
+				if not loadedNormal and secondaryNormal:
+					loadedNormal = True
+					material.setNormalTexture(secondaryNormal[0])
+					if secondaryNormal[0] not in usedTextures:
+						self.vramHashes.append(secondaryNormal[1])
+						usedTextures.append(secondaryNormal[0])
+				if not loadedTrans and secondaryAlpha:
+					loadedTrans = True
+					material.setAlphaTest(0.25)
+					material.setOpacityTexture(secondaryAlpha[0])
+					if secondaryAlpha[0] not in usedTextures:
+						self.vramHashes.append(secondaryAlpha[1])
+						usedTextures.append(secondaryAlpha[0])
 				
-				if dialogOptions.isTLOU2 or dialogOptions.isTLOUP1:
-					UUID = bs.readUInt64()
-					shaderParamsOffs = readPointerFixup(True)
-					texDescsListOffs = readPointerFixup()
-					shaderNamesOffs = readPointerFixup()
-					uknOffs = readPointerFixup()
-					fetchMapDescsOffs = readPointerFixup()
-					bs.seek(52*4, 1)
-					paramCount = bs.readUInt()
-					texCount = bs.readUInt()
-					nameCount = bs.readUInt()
-					fetchMapCount = bs.readUInt()
-				else:
-					shaderOptions0Offs = readPointerFixup()
-					hashCodeOffs = readPointerFixup()
-					shaderParamsOffs = readPointerFixup()
-					texDescsListOffs = readPointerFixup()
-					shaderOptions3Offs = readPointerFixup()
-					nameCount = bs.readUInt()
-					paramCount = bs.readUInt()
-					texCount = bs.readUInt()
-					unkCount = bs.readUInt()
+				params = {}
+				setBaseColor = setSpecScale = setRoughness = setMetal = False
+				outstring = "\n" + matKey + "material parameters:"
 				
-				matName = readStringAt(bs, shaderAssetNameOffs)
-				matType = readStringAt(bs, shaderTypeOffs)
-				matKey = rapi.getLocalFileName(matName[:matName.find(":")])
-				'''fullName = matKey
-				counter = 0
-				allMatNames = [mat.name for addr, mat in usedMaterials.items()]
-				while fullName in allMatNames:
-					counter += 1
-					fullName = matKey + "_" + str(counter)
-				matKey = fullName'''
-				
-				material = usedMaterials.get(m_material) 
+				for name, values in matDesc.params:
+					numFloats = len(values)
+					params[name] = [0.0, 0.0, 0.0, 1.0]
+					for p in range(numFloats):
+						params[name][p] = values[p]
+					if numFloats == 1:
+						outstring = outstring + "\n	" + name + ":  " + str(params[name][0])
+					else:
+						outstring = outstring + "\n	" +  name + ":  " + str(params[name])
+					lowerName = name.lower()
+					if True: #lowerName.find("01") != -1:
+						if numFloats==3 and not setBaseColor and not material.texName and lowerName.find("basecolor") != -1:
+							setBaseColor = True
+							material.setDiffuseColor(params[name])
+						elif numFloats==1 and not setSpecScale and not loadedMetal and not loadedRoughness and lowerName.find("spec") != -1 :
+							setSpecScale = True
+							material.setSpecularColor(NoeVec4([0.5*params[name][0], 0.5*params[name][0], 0.5*params[name][0], 32.0]))
+						elif numFloats==1 and not setRoughness and lowerName.find("roughness") != -1:
+							setRoughness = True
+							material.setRoughness(params[name][0], 0.5)
+						elif numFloats==1 and not setMetal and lowerName.find("metal") != -1:
+							setMetal = True
+							material.setMetal(params[name][0], 0.0)
 				
-				if not material:
-					rapi.setPreviewOption("autoLoadNonDiffuse", "1")
-					material = NoeMaterial(matKey, "")
-					#materialFlags = 0
-					material.setDefaultBlend(0)
-					material.setSpecularColor(NoeVec4([0.5, 0.5, 0.5, 32.0])) 
-					secondaryDiffuse = []
-					secondaryNormal = []
-					secondaryAlpha = []
-					loadedDiffuse = loadedNormal = loadedTrans = loadedSpec = loadedMetal = loadedRoughness = loadedOcc = False
+				if dialogOptions.printMaterialParams:
+					print(outstring, "\n")
 					
-					for j in range(texCount):
-						bs.seek(texDescsListOffs + (40+8*(dialogOptions.isTLOU2 or dialogOptions.isTLOUP1))*j )
-						nameAddr = readPointerFixup()
-						name = readStringAt(bs, nameAddr)
-						bs.seek(8+8*(dialogOptions.isTLOU2 or dialogOptions.isTLOUP1),1) #path = readStringAt(bs, readPointerFixup())
-						bs.seek(readPointerFixup())
-						path = readStringAt(bs, readPointerFixup())
-						vramHash = bs.readUInt64()
-						texFileName = self.vrams[vramHash][1] if vramHash in self.vrams else ""
-						doSet = False
-						
-						if texFileName.count("missing"):
-							continue
-						
-						if texFileName and name.find("01") != -1:
-							if not loadedDiffuse and name.find("BaseColor01") != -1:
-								doSet = loadedDiffuse = vramHash 
-								material.setTexture(texFileName)
-							elif not loadedNormal and (name.find("Normal01") != -1 or name.find("NR") != -1):
-								doSet = loadedNormal = vramHash
-								material.setNormalTexture(texFileName)
-								if dialogOptions.doConvertTex:
-									#if gameName != "TLOUP1":
-									material.flags |= noesis.NMATFLAG_NORMALMAP_FLIPY #| noesis.NMATFLAG_NORMALMAP_NODERZ
-									if name.find("NR") != -1 and texFileName.find("-ao") != -1: # Ambient Occlusion
-										self.vrams[vramHash][2].append(texFileName.replace(texoutExt, "_NoesisAO" + texoutExt))
-										material.setOcclTexture(self.vrams[vramHash][2][len(self.vrams[vramHash][2])-1])
-								
-							elif not loadedTrans and name.find("Transparency01") != -1:
-								doSet = loadedTrans = vramHash
-								material.setOpacityTexture(texFileName)
-								material.setAlphaTest(0.05)
-								material.flags |= noesis.NMATFLAG_TWOSIDED
-								
-								if dialogOptions.doConvertTex:
-									if not loadedNormal:
-										self.vrams[vramHash][2].append("NoesisNRM" + texoutExt)
-										material.setNormalTexture(self.vrams[vramHash][2][len(self.vrams[vramHash][2])-1])
-									if not loadedDiffuse:
-										self.vrams[vramHash][2].append("NoesisBrown" + texoutExt)
-										material.setTexture(self.vrams[vramHash][2][len(self.vrams[vramHash][2])-1])
-									
-							elif not loadedSpec and name.find("pecular") != -1:
-								doSet = loadedSpec = vramHash
-								material.setSpecularTexture(texFileName)
-								#material.flags |= noesis.NMATFLAG_PBR_SPEC
-							elif not loadedOcc and name.find("Ao01") != -1:
-								doSet = loadedOcc = vramHash
-								material.setOcclTexture(texFileName)
-								
-						if not loadedDiffuse and not secondaryDiffuse and (name.find("Color0") != -1):
-							secondaryDiffuse = [texFileName, vramHash]
-						if not loadedNormal and not secondaryNormal and name.find("Normal0") != -1: # and not (texFileName.count("tile") or texFileName.count("detail")):
-							secondaryNormal = [texFileName, vramHash]
-						if not loadedTrans and not secondaryAlpha and (name.find("Transparency0") != -1):
-							secondaryAlpha = [texFileName, vramHash]
-								
-						'''if dialogOptions.doConvertTex and not loadedSpec :
-							if  (name.find("LinearBlend0") != -1 or name.find("ME") != -1): #not loadedMetal and
-								if not loadedRoughness:
-									doSet = loadedMetal = vramHash
-									material.setSpecularTexture(texFileName)
-									material.setSpecularSwizzle( NoeMat44([[0, 0, 1, 0], [1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 1]]) )
-								elif loadedRoughness != vramHash:
-									self.vrams[loadedRoughness][2].append([vramHash, 0, 0]) #copy red channel of this texture to red channel of roughness texture (which has been set as specular)
-								else:
-									material.setRoughness(0.75, 0.0)
-								material.flags |= noesis.NMATFLAG_PBR_SPEC_IR_RG | noesis.NMATFLAG_PBR_METAL
-								material.setMetal(0.5, 0.0)
-								
-							if not loadedRoughness and (name.find("Curvature0") != -1 or name.find("RO") != -1):
-								if not loadedMetal:
-									doSet = loadedRoughness = vramHash
-									material.setSpecularTexture(texFileName)
-								elif loadedMetal != vramHash:
-									self.vrams[loadedMetal][2].append([vramHash, 0, 1])  #copy red channel of this texture to green channel of metal texture (which has been set as specular)
-								else:
-									material.setMetal(0.0, 0.0)
-								material.flags |= noesis.NMATFLAG_PBR_SPEC_IR_RG | noesis.NMATFLAG_PBR_METAL
-								material.setRoughness(0.75, 0.5)'''
-								
-						doSet = doSet or dialogOptions.loadAllTextures
-						
-						if doSet and texFileName and texFileName not in usedTextures:
-							self.vramHashes.append(vramHash)
-							usedTextures.append(texFileName)
-					
-					if not loadedDiffuse and secondaryDiffuse:
-						loadedDiffuse = True
-						material.setTexture(secondaryDiffuse[0])
-						if secondaryDiffuse[0] not in usedTextures:
-							self.vramHashes.append(secondaryDiffuse[1])
-							usedTextures.append(secondaryDiffuse[0])
-					if not loadedNormal and secondaryNormal:
-						loadedNormal = True
-						material.setNormalTexture(secondaryNormal[0])
-						if secondaryNormal[0] not in usedTextures:
-							self.vramHashes.append(secondaryNormal[1])
-							usedTextures.append(secondaryNormal[0])
-					if not loadedTrans and secondaryAlpha:
-						loadedTrans = True
-						material.setAlphaTest(0.25)
-						material.setOpacityTexture(secondaryAlpha[0])
-						if secondaryAlpha[0] not in usedTextures:
-							self.vramHashes.append(secondaryAlpha[1])
-							usedTextures.append(secondaryAlpha[0])
-					
-					params = {}
-					setBaseColor = setSpecScale = setRoughness = setMetal = False
-					outstring = "\n" + matKey + "material parameters:"
-					
-					for j in range(paramCount):
-						bs.seek(shaderParamsOffs + 24*j)
-						name = readStringAt(bs, readPointerFixup(True))
-						valueOffset = readPointerFixup()
-						numFloats = bs.readUInt()
-						bs.seek(valueOffset)
-						params[name] = [0.0, 0.0, 0.0, 1.0]
-						for p in range(numFloats):
-							params[name][p] = bs.readFloat()
-						if numFloats == 1:
-							outstring = outstring + "\n	" + name + ":  " + str(params[name][0])
-						else:
-							outstring = outstring + "\n	" +  name + ":  " + str(params[name])
-						lowerName = name.lower()
-						if True: #lowerName.find("01") != -1:
-							if numFloats==3 and not setBaseColor and not material.texName and lowerName.find("basecolor") != -1:
-								setBaseColor = True
-								material.setDiffuseColor(params[name])
-							elif numFloats==1 and not setSpecScale and not loadedMetal and not loadedRoughness and lowerName.find("spec") != -1 :
-								setSpecScale = True
-								material.setSpecularColor(NoeVec4([0.5*params[name][0], 0.5*params[name][0], 0.5*params[name][0], 32.0]))
-							elif numFloats==1 and not setRoughness and lowerName.find("roughness") != -1:
-								setRoughness = True
-								material.setRoughness(params[name][0], 0.5)
-							elif numFloats==1 and not setMetal and lowerName.find("metal") != -1:
-								setMetal = True
-								material.setMetal(params[name][0], 0.0)
-					
-					if dialogOptions.printMaterialParams:
-						print(outstring, "\n")
-						
-					if dialogOptions.doConvertTex and not material.texName and ((not loadedNormal and not loadedTrans and not loadedSpec and not setBaseColor) or matKey.find("lens") != -1):
-						material.setSkipRender(True)
-					
-					usedMaterials[m_material] = material
-					self.matList.append(material)
-				
-				self.matNames.append(material.name)
+				if dialogOptions.doConvertTex and not material.texName and ((not loadedNormal and not loadedTrans and not loadedSpec and not setBaseColor) or matKey.find("lens") != -1):
+					material.setSkipRender(True)
 				
-				bs.seek(place)
+				usedMaterials[sm.material] = material
+				self.matList.append(material)
 			
-			
-	def loadGeometry(self, startingBonesCt=0):
+			self.matNames.append(material.name)
+	
+	#decodedSubmeshes can be passed from an earlier iterSubmeshes(readSkin=False) run
+	def loadGeometry(self, startingBonesCt=0, decodedSubmeshes=None):
 		
 		bs = self.bs
-		rapi.rpgSetTransform((NoeVec3((GlobalScale,0,0)), NoeVec3((0,GlobalScale,0)), NoeVec3((0,0,GlobalScale)), NoeVec3((0,0,0)))) 
+		rapi.rpgSetTransform((NoeVec3((self.scale,0,0)), NoeVec3((0,self.scale,0)), NoeVec3((0,0,self.scale)), NoeVec3((0,0,0)))) 
 		
 		if self.submeshes:
 			
-			lastLOD = 0
-			
 			if dialogOptions.doLoadTex:
 				alreadyLoadedList = [tex.name for tex in self.texList]
 				for vramHash in self.vramHashes:
 					if vramHash not in self.vrams:
 						continue
 					
-					tex = self.loadVRAM(self.vrams[vramHash][0])
+					tex = self.loadVRAM(self.vrams[vramHash].offset)
 					if tex and tex.name not in alreadyLoadedList:  
 						self.texList.append(tex)
 						alreadyLoadedList.append(tex.name)
 					
 					# Load separated channel textures and dummy textures, or merge metal+roughness into specular:
-					if self.vrams[vramHash][2]: 
-						for texNameOrList in self.vrams[vramHash][2]:
+					if self.vrams[vramHash].extraTextures: 
+						for texNameOrList in self.vrams[vramHash].extraTextures:
 							if isinstance(texNameOrList, list):
 								print("Found merge hash", texNameOrList[0], "for", tex.name)
-								channelTex = self.loadVRAM(self.vrams[texNameOrList[0]][0])
+								channelTex = self.loadVRAM(self.vrams[texNameOrList[0]].offset)
 								tex.pixelData = moveChannelsRGBA(channelTex.pixelData, texNameOrList[1], channelTex.width, channelTex.height, tex.pixelData, texNameOrList[2], tex.width, tex.height)
 								
 							elif texNameOrList not in alreadyLoadedList:
-								dummyTex = self.loadVRAM(self.vrams[vramHash][0], texNameOrList)
+								dummyTex = self.loadVRAM(self.vrams[vramHash].offset, texNameOrList)
 								if dummyTex:
 									self.texList.append(dummyTex)
 									alreadyLoadedList.append(dummyTex.name)
 				
 				if dialogOptions.loadAllTextures:
-					for vramHash, subTuple in self.vrams.items():
-						if subTuple[1] and subTuple[1] not in alreadyLoadedList:
-							tex = self.loadVRAM(subTuple[0])
+					for vramHash, vram in self.vrams.items():
+						if vram.name and vram.name not in alreadyLoadedList:
+							tex = self.loadVRAM(vram.offset)
 							if tex:  
 								self.texList.append(tex)
 								alreadyLoadedList.append(tex.name)
 			
-			def movePositionsBuffer(buffer, mat, stride=12):
-				if mat and stride == 12:
-					posList = []
-					for v in range(int(len(buffer)/12)):
-						idx = 12 * v
-						transVec = NoeVec3(((struct.unpack_from('f', buffer, idx))[0], (struct.unpack_from('f', buffer, idx + 4))[0], (struct.unpack_from('f', buffer, idx + 8))[0])) * mat.toQuat()
-						transVec += mat[3]
-						posList.extend((transVec[0], transVec[1], transVec[2]))
-					buffer = struct.pack("<" + 'f'*len(posList), *posList)
-				return buffer
+			#the instance rotation is sampled through the quaternion so it matches Noesis' own transform convention. Rotation and translation rows only, any scale is dropped
+			def getInstanceRows(mat):
+				quat = mat.toQuat()
+				rows = [tuple(NoeVec3(axis) * quat)[:3] for axis in ((1,0,0), (0,1,0), (0,0,1))]
+				rows.append((mat[3][0], mat[3][1], mat[3][2]))
+				return rows
 			
-			for i, sm in enumerate(self.submeshes):
-				lodFind = sm.name.find("Shape")
-				LODidx = int(sm.name[lodFind+5]) if lodFind != -1 and sm.name[lodFind+5].isnumeric() else 0
-				if LODidx > lastLOD:
-					lastLOD = LODidx
-				if not dialogOptions.doLODs and LODidx > 0:
-					continue
-				
+			def movePositionsBuffer(buffer, mat, stride=12):
+				if mat and buffer and stride in (12, 8):
+					return transformPositions(buffer, getInstanceRows(mat), stride), 12
+				return buffer, stride
+			
+			if decodedSubmeshes is None:
+				decodedSubmeshes = self.iterSubmeshes(None if dialogOptions.doLODs else 0, bool(self.boneList), startingBonesCt)
+			for decoded in decodedSubmeshes:
+				i, sm = decoded.index, decoded.submesh
 				rapi.rpgSetName(sm.name)
 				rapi.rpgSetMaterial(self.matNames[i])
-				foundUVs = foundNormals = foundColors = 0
 				posBuff = []
 				posStride = 12
 				
-				for j, sd in enumerate(sm.streamDescs):
-					print(i, sd.offset)
-					bs.seek(sd.offset)
-					if dialogOptions.isTLOU2 or dialogOptions.isTLOUP1:
-						if j == 0 and sd.stride==12:
-							posBuff = bs.readBytes(sd.stride * sm.numVerts)
-							posStride = sd.stride
-						elif sd.type == 1:
-							rapi.rpgBindUV1Buffer(bs.readBytes(4 * sm.numVerts), noesis.RPGEODATA_HALFFLOAT, 4)
-						elif sd.type == 2:
-							rapi.rpgBindNormalBuffer(bs.readBytes(4 * sm.numVerts), noesis.RPGEODATA_BYTE, 4)
-						elif sd.type == 3:
-							rapi.rpgBindTangentBuffer(bs.readBytes(4 * sm.numVerts), noesis.RPGEODATA_BYTE, 4)
-						elif sd.type == 11:
-							rapi.rpgBindUV2Buffer(bs.readBytes(4 * sm.numVerts), noesis.RPGEODATA_HALFFLOAT, 4)
+				for stream in decoded.streams:
+					dataType = noesis.RPGEODATA_FLOAT if stream.dtype == "<f4" else noesis.RPGEODATA_HALFFLOAT
+					if stream.semantic == "position":
+						posBuff = stream.data
+						posStride = stream.stride
+					elif stream.semantic == "uv":
+						if stream.index == 0:
+							rapi.rpgBindUV1Buffer(stream.data, dataType, stream.stride)
+						elif stream.index == 1:
+							rapi.rpgBindUV2Buffer(stream.data, dataType, stream.stride)
 						else:
-							floatsList = []
-							for v in range(sd.numVerts):
-								for c in range(4):
-									if sd.sizes[c]:
-										floatsList.append(bs.readBits(sd.sizes[c]) * sd.qScale[c] + sd.qOffs[c])
-									elif sd.type == 64 and c < 3:
-										floatsList.append(sd.qScale[c] + sd.qOffs[c])
-							floatsBuffer = struct.pack("<" + 'f'*len(floatsList), *floatsList)
-							#try:
-							if floatsBuffer:
-								if sd.type == 64:
-									posBuff = floatsBuffer
-								elif sd.type == 65: 
-									rapi.rpgBindUV1Buffer(floatsBuffer, noesis.RPGEODATA_FLOAT, 8)
-								elif sd.type == 75: 
-									rapi.rpgBindUV2Buffer(floatsBuffer, noesis.RPGEODATA_FLOAT, 8)
-								elif sd.type == 76: 
-									rapi.rpgBindUVXBuffer(floatsBuffer, noesis.RPGEODATA_FLOAT, 8, 2, sd.numVerts)
-								else:
-									print("Buffer type not read:", sd.type)
-							#except:
-							#	print("Failed to bind buffer type", sd.type)
-					else:
-						#Positions
-						if j == 0:
-							posBuff = bs.readBytes(sd.stride * sm.numVerts)
-							posStride = sd.stride
-						#UVs
-						elif sd.type == 34: 
-							foundUVs += 1
-							rapi.rpgBindUVXBuffer(bs.readBytes(4 * sm.numVerts), noesis.RPGEODATA_HALFFLOAT, 4, foundUVs-1, sm.numVerts)
-						#Normals/Tangents
-						elif sd.type == 31 and foundNormals != 2:
-							foundNormals += 1
-							if foundNormals == 1:
-								rapi.rpgBindNormalBuffer(bs.readBytes(4 * sm.numVerts), noesis.RPGEODATA_BYTE, 4)
-							elif foundNormals == 2:
-								rapi.rpgBindTangentBuffer(bs.readBytes(4 * sm.numVerts), noesis.RPGEODATA_BYTE, 4)
-						#Extra vec4 halfs
-						elif sd.type == 10:
-							foundColors += 1
-							if dialogOptions.readColors  and foundColors == 1:
-								rapi.rpgBindColorBufferOfs(bs.readBytes(8 * sm.numVerts), noesis.RPGEODATA_HALFFLOAT, 4, 0, 4)
-							else:
-								self.userStreams[i] = self.userStreams.get(i) or []
-								self.userStreams[i].append(NoeUserStream("Vec4Halfs_" + str(foundColors-1), bs.readBytes(8 * sm.numVerts), 8, 0))
+							rapi.rpgBindUVXBuffer(stream.data, dataType, stream.stride, stream.index, sm.numVerts)
+					elif stream.semantic == "normal":
+						rapi.rpgBindNormalBuffer(stream.data, noesis.RPGEODATA_BYTE, 4)
+					elif stream.semantic == "tangent":
+						rapi.rpgBindTangentBuffer(stream.data, noesis.RPGEODATA_BYTE, 4)
+					elif stream.semantic == "color":
+						if dialogOptions.readColors and stream.index == 0:
+							rapi.rpgBindColorBufferOfs(stream.data, noesis.RPGEODATA_HALFFLOAT, 4, 0, 4)
 						else:
-							print("Omitting vertex component type", sd.type, "found at", bs.tell())
+							self.userStreams[i] = self.userStreams.get(i) or []
+							self.userStreams[i].append(NoeUserStream("Vec4Halfs_" + str(stream.index), stream.data, 8, 0))
 				
 				if self.boneList and sm.skinDesc:
-					bs.seek(sm.skinDesc.mapOffset)
-					vertWeightOffsets = []
-					for b in range(sm.numVerts):
-						vertWeightOffsets.append((bs.readUInt(), bs.readUInt()))
-					idsList = []
-					weightList = []
-					for v, offsetsCounts in enumerate(vertWeightOffsets):
-						bs.seek(sm.skinDesc.weightsOffset + offsetsCounts[1])
-						for w in range(12):
-							if w >= offsetsCounts[0]:
-								weightList.append(0)
-								idsList.append(0)
-							elif sm.skinDesc.uncompressed:
-								weightList.append(bs.readFloat())
-								idsList.append(bs.readUInt())
-							else:
-								weightList.append(bs.readBits(22))
-								idsList.append(bs.readBits(10) + startingBonesCt)
+					idsBuffer, weightsBuffer = (decoded.boneIds, decoded.boneWeights) if decoded.boneIds is not None else self.readSkinWeights(sm, startingBonesCt)
 					if sm.skinDesc.uncompressed:
-						rapi.rpgBindBoneIndexBufferOfs(struct.pack("<" + 'I'*len(idsList), *idsList), noesis.RPGEODATA_UINT, 48, 0, 12)
-						rapi.rpgBindBoneWeightBufferOfs(struct.pack("<" + 'f'*len(weightList), *weightList), noesis.RPGEODATA_FLOAT, 48, 0, 12)
+						rapi.rpgBindBoneIndexBufferOfs(idsBuffer, noesis.RPGEODATA_UINT, 48, 0, 12)
+						rapi.rpgBindBoneWeightBufferOfs(weightsBuffer, noesis.RPGEODATA_FLOAT, 48, 0, 12)
 					else:
-						rapi.rpgBindBoneIndexBufferOfs(struct.pack("<" + 'H'*len(idsList), *idsList), noesis.RPGEODATA_USHORT, 24, 0, 12)
-						rapi.rpgBindBoneWeightBufferOfs(struct.pack("<" + 'I'*len(weightList), *weightList), noesis.RPGEODATA_UINT, 48, 0, 12)
+						rapi.rpgBindBoneIndexBufferOfs(idsBuffer, noesis.RPGEODATA_USHORT, 24, 0, 12)
+						rapi.rpgBindBoneWeightBufferOfs(weightsBuffer, noesis.RPGEODATA_UINT, 48, 0, 12)
 						
-				bs.seek(sm.facesOffset)
-				faceBuffer = bs.readBytes(2 * sm.numIndices)
-				instanceList = self.xforms.get(sm.offset) or [None]
-				firstPosBuff = movePositionsBuffer(posBuff, instanceList[0], posStride)
+				faceBuffer = decoded.indices
+				instanceList = [NoeMat44([NoeVec4(row) for row in inst.matrix]).toMat43() for inst in self.getSubmeshInstances(sm)]
+				#skinned meshes are still copied per placement, they are already weighted to their skeleton
+				if dialogOptions.shareInstances and instanceList and not (self.boneList and sm.skinDesc):
+					for j, mat in enumerate(instanceList):
+						rows = getInstanceRows(mat)
+						rows[3] = tuple(value * self.scale for value in rows[3])
+						self.instanceBones.append(NoeBone(0, sm.name + "#" + str(j), NoeMat43([NoeVec3(row) for row in rows])))
+					#committed once at the first placement, then weighted to its bone by pakLoadModel once bone indices are final
+					self.instanceMeshes[sm.name + "#0"] = self.instanceBones[-len(instanceList)]
+					rapi.rpgSetName(sm.name + "#0")
+					instanceList = instanceList[:1]
+				instanceList = instanceList or [None]
+				firstPosBuff, firstPosStride = movePositionsBuffer(posBuff, instanceList[0], posStride)
 				success = False
 				
 				try:
 					idxList = [(struct.unpack_from('H', faceBuffer, i*2))[0] for i in range(int(len(faceBuffer)/2))]
-					rapi.rpgBindPositionBuffer(firstPosBuff, noesis.RPGEODATA_FLOAT if posStride==12 else noesis.RPGEODATA_HALFFLOAT, posStride)
+					rapi.rpgBindPositionBuffer(firstPosBuff, noesis.RPGEODATA_FLOAT if firstPosStride==12 else noesis.RPGEODATA_HALFFLOAT, firstPosStride)
 					rapi.rpgCommitTriangles(faceBuffer, noesis.RPGEODATA_USHORT, sm.numIndices, noesis.RPGEO_TRIANGLE, 0x1)
 					success = True
 				except:
@@ -2671,13 +1880,14 @@ class PakFile:
 				if success:
 					for i in range(1, len(instanceList)):
 						rapi.rpgSetName(sm.name + "#" + str(i))
-						rapi.rpgBindPositionBuffer(movePositionsBuffer(posBuff, instanceList[i], posStride), noesis.RPGEODATA_FLOAT if posStride==12 else noesis.RPGEODATA_HALFFLOAT, posStride)
+						instPosBuff, instPosStride = movePositionsBuffer(posBuff, instanceList[i], posStride)
+						rapi.rpgBindPositionBuffer(instPosBuff, noesis.RPGEODATA_FLOAT if instPosStride==12 else noesis.RPGEODATA_HALFFLOAT, instPosStride)
 						rapi.rpgCommitTriangles(faceBuffer, noesis.RPGEODATA_USHORT, sm.numIndices, noesis.RPGEO_TRIANGLE, 0x1)
 				
 				rapi.rpgClearBufferBinds()
 				
 			print("\n====================================\n\"" + rapi.getLocalFileName(self.path or rapi.getInputName()) + "\" Textures list:")
-			sortedTupleList = sorted([ (subTuple[1], subTuple[0]) for hash, subTuple in self.vrams.items() ])
+			sortedTupleList = sorted([ (vram.name, vram.offset) for hash, vram in self.vrams.items() ])
 			for sortTuple in sortedTupleList:
 				if sortTuple[0]:
 					print("    " + sortTuple[0].replace(".tga", texoutExt) + "  --  " + str(dxFormat.get(readUIntAt(bs, sortTuple[1]+72))))
@@ -2688,6 +1898,14 @@ class PakFile:
 			
 		return 1
 
+#Core parse of a pak merged from the dialog load list. Runs on worker threads, so it must not touch rapi or noesis;
+#its geometry is decoded later by loadGeometry, one submesh at a time
+def parseMergePak(path, args={}):
+	otherPak = PakFile(PakStream.fromFile(path), dict(args, path=path))
+	PakReader.readPakHeader(otherPak)
+	PakReader.readPak(otherPak, None if dialogOptions.doLODs else [0])
+	return otherPak
+
 def pakLoadModel(data, mdlList):
 	
 	global dialogOptions, gameName
@@ -2697,6 +1915,8 @@ def pakLoadModel(data, mdlList):
 	
 	if noesis.optWasInvoked("-lods"):
 		dialogOptions.doLODs = True
+	if noesis.optWasInvoked("-instances"):
+		dialogOptions.shareInstances = True
 	
 	#Close existing dialog (if open)
 	if dialogOptions.dialog and dialogOptions.dialog.isOpen:
@@ -2705,9 +1925,10 @@ def pakLoadModel(data, mdlList):
 		dialogOptions.dialog.noeWnd.closeWindow()
 	
 	noDialog = noesis.optWasInvoked("-nodialog") or NoDialog
-	pak = PakFile(NoeBitStream(data), {'path':rapi.getInputName()})
-	ctx = rapi.rpgCreateContext()
 	gameName = getGameName()
+	pak = PakFile(PakStream(data), {'path':rapi.getInputName(), 'gameName':gameName})
+	ctx = rapi.rpgCreateContext()
+	dialog = None
 	
 	if not noDialog:
 		pak.readPakHeader()
@@ -2723,16 +1944,16 @@ def pakLoadModel(data, mdlList):
 		if noDialog:
 			if pak.submeshes[0].skinDesc and not pak.boneList and dialogOptions.doLoadBase:
 				guessedName = pak.path.replace(".pak", ".skel.pak")
-				for key, value in baseSkeletons[gameName].items():
+				for key, value in baseSkeletons[pak.gameName].items():
 					if pak.path.find(key) != -1:
-						guessedName = BaseDirectories[gameName] + value
+						guessedName = BaseDirectories[pak.gameName] + value
 						break
 				skelPath = guessedName
 				
 				while skelPath and not rapi.checkFileExists(skelPath):
 					skelPath = noesis.userPrompt(noesis.NOEUSERVAL_FILEPATH, "Skeleton Not Found", "Input the path to the .pak containing this model's skeleton", guessedName, None) 
 				if skelPath and rapi.checkFileExists(skelPath):
-					pak.basePak = PakFile(NoeBitStream(rapi.loadIntoByteArray(skelPath)), {'path':skelPath})
+					pak.basePak = PakFile(PakStream.fromFile(skelPath), {'path':skelPath, 'gameName':pak.gameName, 'scale':pak.scale, 'baseSkeleton':""})
 					pak.basePak.readPak()
 					pak.boneList = pak.basePak.boneList
 					pak.boneMap = pak.basePak.boneMap
@@ -2740,17 +1961,26 @@ def pakLoadModel(data, mdlList):
 				else:
 					print("Failed to load Skeleton", skelPath or "[No path found]")
 		else:
-			for fullOtherPath in dialog.fullLoadItems:
-				if rapi.getLocalFileName(fullOtherPath) != dialog.name: 
-					if rapi.checkFileExists(fullOtherPath):
-						otherPak = PakFile(NoeBitStream(rapi.loadIntoByteArray(fullOtherPath)), {'path':fullOtherPath})
-						otherPak.texList = pak.texList
-						otherPak.matList = pak.matList
-						otherPak.boneList = pak.boneList
-						otherPak.doLODs = pak.doLODs
-						startingBonesCt = len(pak.boneList) if pak.boneList else 0
-						otherPak.readPak()
-						otherPak.loadGeometry(startingBonesCt if otherPak.jointOffset != None else 0)
+			otherPaths = [fullOtherPath for fullOtherPath in dialog.fullLoadItems if rapi.getLocalFileName(fullOtherPath) != dialog.name and rapi.checkFileExists(fullOtherPath)]
+			parsedPaks = [None] * len(otherPaths)
+			mergeArgs = {'gameName':pak.gameName, 'scale':pak.scale}
+			if ParallelPakLoads and len(otherPaths) > 1:
+				with ThreadPoolExecutor(min(len(otherPaths), os.cpu_count() or 1)) as pool:
+					parsedPaks = list(pool.map(parseMergePak, otherPaths, [mergeArgs] * len(otherPaths)))
+			for fullOtherPath, parsed in zip(otherPaths, parsedPaks):
+				otherPak = parsed or PakFile(PakStream.fromFile(fullOtherPath), dict(mergeArgs, path=fullOtherPath))
+				otherPak.texList = pak.texList
+				otherPak.matList = pak.matList
+				otherPak.boneList = pak.boneList
+				otherPak.doLODs = pak.doLODs
+				otherPak.instanceBones = pak.instanceBones
+				otherPak.instanceMeshes = pak.instanceMeshes
+				startingBonesCt = len(pak.boneList) if pak.boneList else 0
+				try:
+					otherPak.readPak(parsed=parsed != None)
+					otherPak.loadGeometry(startingBonesCt if otherPak.jointOffset != None else 0)
+				finally:
+					otherPak.closeStreams()
 		try:
 			mdl = rapi.rpgConstructModelAndSort()
 		except:
@@ -2762,6 +1992,16 @@ def pakLoadModel(data, mdlList):
 		
 		mdlList.append(mdl)
 		
+		if pak.instanceBones:
+			pak.boneList = pak.boneList or []
+			for bone in pak.instanceBones:
+				bone.index = len(pak.boneList)
+				pak.boneList.append(bone)
+			for mesh in mdl.meshes:
+				bone = pak.instanceMeshes.get(mesh.name)
+				if bone:
+					mesh.setWeights([NoeVertWeight([bone.index], [1.0])] * len(mesh.positions))
+		
 		if pak.boneList:
 			pak.boneList = rapi.multiplyBones(pak.boneList)
 			if dialog and len(dialog.loadItems) > 1:
@@ -2778,7 +2018,9 @@ def pakLoadModel(data, mdlList):
 					mdl.meshes[meshIdx].setUserStreams(userStreamList)
 		#for mesh in mdl.meshes:
 		#	print (mesh.name, mesh.positions)
-		
+	
+	pak.closeStreams()
+	dialogOptions.dictFiles.close()
 	return 1
 
 def pakWriteModel(mdl, bs):
@@ -2844,7 +2086,7 @@ def pakWriteModel(mdl, bs):
 			dialogOptions.baseSkeleton = fileName
 			
 	source.readPakHeader()
-	texOnly = noesis.optWasInvoked("-t") or dialogOptions.isTLOU2 or dialogOptions.isTLOUP1
+	texOnly = noesis.optWasInvoked("-t") or source.isTLOU2 or source.isTLOUP1
 	if texOnly:
 		print("Embedding textures only")
 	
@@ -2962,7 +2204,7 @@ def pakWriteModel(mdl, bs):
 					
 					print("Injecting ", writeMesh.name)
 					appendedPositions = appendedWeights = appendedIndices = isModded #False
-					newPageDataAddr = source.pakPageEntries[len(source.pakPageEntries)-1][0] + source.pakPageEntries[len(source.pakPageEntries)-1][1]
+					newPageDataAddr = source.getRawDataStart()
 					owningIndex = source.pakPageEntries[len(source.pakPageEntries)-1][2]
 					vertOffs = submeshesAddr + 176*i + 36
 					foundPositions = foundUVs = foundNormals = 0
@@ -3249,8 +2491,8 @@ def pakWriteModel(mdl, bs):
 		if os.path.isdir(path):
 			source.bs = bs
 			vramPathDict = {}
-			for hash, vramTuple in source.vrams.items():
-				vramPathDict[vramTuple[1]] = (vramTuple[0], hash)
+			for hash, vram in source.vrams.items():
+				vramPathDict[vram.name] = (vram.offset, hash)
 				
 			for fileName in os.listdir(path):
 				if os.path.isfile(os.path.join(path, fileName)) and fileName.count(texoutExt):
@@ -3334,6 +2576,7 @@ def pakWriteModel(mdl, bs):
 		
 		if newBaseFile:
 			print("Wrote new skeleton to", newBaseFile)
-		
+	
+	source.closeStreams()
 	return 1
 	
@@ -0,0 +1,1625 @@
+#inc_nd_pak.py - Naughty Dog ".pak" reader core, usable with or without Noesis
+#Author: alphaZomega
+#Special Thanks: icemesh
+#Parses pak headers, skeletons and geometry/VRAM descriptors in pure Python. fmt_nd_pak.py builds its Noesis objects on top of this
+
+from collections import namedtuple, OrderedDict
+from array import array
+from bisect import bisect_right
+import struct
+import mmap
+import sys
+import os
+import pickle
+import json
+import zlib
+import weakref
+
+try:
+	import numpy as np
+except ImportError: #Noesis does not ship numpy, everything has a pure Python fallback
+	np = None
+
+PakCacheVersion = 3 #bump whenever the parsed structures below change, so old sidecar caches are ignored
+
+TP1_pakStringIDs = {
+	0x50CAF5257D6A140B: "JOINT_HIERARCHY",
+	0x349D779A792F45C1: "GEOMETRY_1",
+	0xCE3ADE693131B309: "VRAM_DESC",
+	0xE7254422A7A8F476: "VRAM_DESC_TABLE",
+	0xA2481DA1A5D2CE2B: "TEXTURE_TABLE",
+	0x36125D3CFB7F3991: "TEXTURE_DICTIONARY",
+	0x4903731234F1BEA6: "PAK_LOGIN_TABLE",
+	0x61DE7E6141BC6F2B: "EFFECT_TABLE",
+	0x460F497540A29F73: "SPAWNER_GROUP",
+	0x596A72779C4C87D: "TAG_INT",
+	0x53DE1E1977F9CBA4: "ANIM_GROUP",
+	0x791137002DB17EBB: "MATERIAL_TABLE_1",
+	0x384ADF724B123839: "FOREGROUND_SECTION_2",
+	0x5ADB4A2D2E2A6EB: "COLLISION_DATA_CLOTH",
+	0x3A3BB43D817C93DE: "TAG_VEC4",
+	0x35EB8812D3A2D576: "TAG_FLOAT",
+	0x6A98005088A56C5: "LEVEL_BOUNDING_BOX_DATA",
+	0x438E1B0DBFFAA93: "AMBSHADOWS_OCCLUDER_INFO",
+	0x7D9BFD5CEC879080: "COLLISION_DATA_FOREGROUND",
+	0xEC3AFEDF7EF282F0: "SOUND_BANK_TABLE",
+}
+
+LODSubmeshDesc = namedtuple("LODSubmeshDesc", "name address offset index")
+
+JointsInfo = namedtuple("JointsInfo", "transformsStart parentingStart")
+
+PakJoints = namedtuple("PakJoints", "names parents transforms")
+
+StreamDesc = namedtuple("StreamDesc", "type offset stride bufferOffsetAddr")
+
+T2StreamDesc = namedtuple("T2StreamDesc", "type offset stride bufferOffsetAddr sizes qScale qOffs numVerts")
+
+SkinDesc = namedtuple("SkinDesc", "mapOffset weightsOffset weightCount mapOffsetAddr weightOffsetAddr uncompressed")
+
+PakEntry = namedtuple("PakEntry", "type offset")
+
+PakLoginTableEntry = namedtuple("PakLoginTableEntry", "page offset")
+
+PakResItem = namedtuple("PakResItem", "type start offset")
+
+PakMaterialDesc = namedtuple("PakMaterialDesc", "name type textures params")
+
+PakTextureDesc = namedtuple("PakTextureDesc", "name path hash")
+
+VramDesc = namedtuple("VramDesc", "pakOffset vramSize textureDictId hash type imgFormat mipCount width height streamFlags path")
+
+PakSummary = namedtuple("PakSummary", "path game pageCount resItemTypes numSubmeshes hasSkeleton needsBasePak vramHashes")
+
+MeshInstance = namedtuple("MeshInstance", "name matrix")
+
+TextureDictScan = namedtuple("TextureDictScan", "size mtime rawDataStart hashes") #hashes is {str(hash): [VRAM desc offset, dataOffset, vramSize, width, height, imgFormat]}, as in NDTextureHashes.json
+
+TextureDictVram = namedtuple("TextureDictVram", "dataOffset vramSize width height imgFormat") #VRAM desc fields needed to read the image, dataOffset is relative to the raw-data start
+
+TextureLocation = namedtuple("TextureLocation", "world dictFile offset rawDataStart vram") #world is "All" for the U4/TLL texturedict2 folder. vram is None for hashes dumped without it
+
+VertexStream = namedtuple("VertexStream", "semantic index dtype stride data") #dtype is a numpy-style type string of one component
+
+DecodedSubmesh = namedtuple("DecodedSubmesh", "index submesh name material lod numVerts streams boneIds boneWeights indices")
+
+_u8 = struct.Struct("<B")
+_u16 = struct.Struct("<H")
+_s16 = struct.Struct("<h")
+_u32 = struct.Struct("<I")
+_s32 = struct.Struct("<i")
+_u64 = struct.Struct("<Q")
+_s64 = struct.Struct("<q")
+_f32 = struct.Struct("<f")
+_f32x3 = struct.Struct("<3f")
+_f16x3 = struct.Struct("<3e")
+
+#NDTextureHashes.bin: a header, one record per game, then per game its dict table and the hash-sorted uint64 hashes, uint32 VRAM desc offsets, uint16 dict ids and VRAM records (8-byte aligned arrays)
+TextureHashDBMagic = b"NDTH"
+TextureHashDBVersion = 2
+_texDBHeader = struct.Struct("<4s 2I 4x") #magic, version, gameCount
+_texDBGame = struct.Struct("<16s 2I 5Q") #name, hashCount, dictCount, dictsOffs, hashesOffs, offsetsOffs, dictIdsOffs, vramsOffs
+_texDBVram = struct.Struct("<2I 3H") #dataOffset, vramSize (0 if not dumped), width, height, imgFormat
+_vramDescFields = struct.Struct("<I 4x I 20x I 8x 2I") #from VRAM desc +40: offset, vramSize, imgFormat, width, height
+_texDBDict = struct.Struct("<Q 2H") #rawDataStart (0 if unknown), world and dict file name lengths, followed by both names
+
+#176-byte SubmeshDesc layouts, unpacking only the fields the reader uses. Pointer fields map to (tuple index, offset in the desc)
+U4SubmeshDesc = struct.Struct("<8x q 20x 3I i 4x q 8x q q 16x q 24x q 32x")
+U4SubmeshPointers = {"name": (0, 8), "streamDesc": (5, 56), "indexes": (6, 72), "material": (7, 80), "skin": (8, 104), "nrmRecalcDesc": (9, 136)}
+U4SubmeshCounts = 1 #tuple index of numVertexes, numIndexes, numStreamSource
+
+T2SubmeshDesc = struct.Struct("<8f q 8x q 8x q q 8x q 16x q 8x 4I 32x")
+T2SubmeshPointers = {"name": (8, 32), "streamDesc": (9, 48), "indexes": (10, 64), "material": (11, 72), "skin": (12, 88), "nrmRecalcDesc": (13, 112)}
+T2SubmeshCounts = 14
+
+#Little-endian reader with the subset of the NoeBitStream API used by the pak parser
+class PakStream:
+	def __init__(self, data=b""):
+		self.buf = data
+		self.view = None
+		self.views = weakref.WeakValueDictionary() #slices handed out by readView that are still alive, released by close()
+		self.viewCount = 0
+		self.ofs = 0
+		self.bitOfs = 0
+
+	#Maps the file copy-on-write instead of reading it, so only the pages that get read (or patched) are loaded
+	@classmethod
+	def fromFile(cls, path):
+		with open(path, "rb") as f:
+			try:
+				return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+			except ValueError: #empty file
+				return cls(b"")
+
+	def close(self):
+		for view in list(self.views.values()):
+			view.release()
+		self.views.clear()
+		if self.view is not None:
+			self.view.release()
+			self.view = None
+		if isinstance(self.buf, mmap.mmap):
+			self.buf.close()
+
+	def getBuffer(self):
+		return self.buf
+
+	def getSize(self):
+		return len(self.buf)
+
+	def tell(self):
+		return self.ofs
+
+	def seek(self, offset, whence=0):
+		self.ofs = offset if whence == 0 else self.ofs + offset if whence == 1 else len(self.buf) + offset
+		self.bitOfs = 0
+
+	def checkEOF(self):
+		return self.ofs >= len(self.buf)
+
+	def align(self):
+		if self.bitOfs:
+			self.ofs += 1
+			self.bitOfs = 0
+
+	def read(self, st):
+		if self.bitOfs:
+			self.align()
+		value = st.unpack_from(self.buf, self.ofs)[0]
+		self.ofs += st.size
+		return value
+
+	def readUByte(self):
+		return self.read(_u8)
+
+	def readUShort(self):
+		return self.read(_u16)
+
+	def readShort(self):
+		return self.read(_s16)
+
+	def readUInt(self):
+		return self.read(_u32)
+
+	def readInt(self):
+		return self.read(_s32)
+
+	def readUInt64(self):
+		return self.read(_u64)
+
+	def readInt64(self):
+		return self.read(_s64)
+
+	def readFloat(self):
+		return self.read(_f32)
+
+	def readBytes(self, size):
+		if self.bitOfs:
+			self.align()
+		output = bytes(self.buf[self.ofs:self.ofs+size])
+		self.ofs += size
+		return output
+
+	#Zero-copy slice of the underlying buffer, valid until close(). Anything exported from it (e.g. numpy arrays) must be dropped before close()
+	def readView(self, size):
+		if self.bitOfs:
+			self.align()
+		if self.view is None:
+			self.view = memoryview(self.buf)
+		output = self.view[self.ofs:self.ofs+size]
+		self.views[self.viewCount] = output
+		self.viewCount += 1
+		self.ofs += size
+		return output
+
+	def readString(self):
+		if self.bitOfs:
+			self.align()
+		end = self.buf.find(b"\0", self.ofs)
+		if end == -1:
+			end = len(self.buf)
+		output = bytes(self.buf[self.ofs:end]).decode("utf-8", "replace")
+		self.ofs = end + 1
+		return output
+
+	def readBits(self, numBits):
+		pos = (self.ofs << 3) + self.bitOfs
+		value = int.from_bytes(self.buf[pos >> 3:(pos + numBits + 7) >> 3], "little") >> (pos & 7)
+		pos += numBits
+		self.ofs = pos >> 3
+		self.bitOfs = pos & 7
+		return value & ((1 << numBits) - 1)
+
+	def write(self, st, value):
+		st.pack_into(self.buf, self.ofs, value)
+		self.ofs += st.size
+
+	def writeUShort(self, value):
+		self.write(_u16, value)
+
+	def writeUInt(self, value):
+		self.write(_u32, value)
+
+	def writeInt(self, value):
+		self.write(_s32, value)
+
+	def writeBytes(self, data):
+		self.buf[self.ofs:self.ofs+len(data)] = data
+		self.ofs += len(data)
+
+def findNextOf(bs, integer, is64=False):
+	start = bs.tell()
+	while not bs.checkEOF() and ((is64 and bs.readInt64()) or bs.readInt()) != integer:
+		pass
+	output = bs.tell()
+	bs.seek(start)
+	return output
+
+def readStringAt(bs, offset):
+	start = bs.tell()
+	bs.seek(offset)
+	output = bs.readString()
+	bs.seek(start)
+	return output
+
+def readUShortAt(bs, offset):
+	start = bs.tell()
+	bs.seek(offset)
+	output = bs.readUShort()
+	bs.seek(start)
+	return output
+
+def readUInt64At(bs, offset):
+	start = bs.tell()
+	bs.seek(offset)
+	output = bs.readUInt64()
+	bs.seek(start)
+	return output
+
+def readUIntAt(bs, offset):
+	start = bs.tell()
+	bs.seek(offset)
+	output = bs.readUInt()
+	bs.seek(start)
+	return output
+
+def writeUIntAt(bs, offset, value):
+	start = bs.tell()
+	bs.seek(offset)
+	bs.writeUInt(value)
+	bs.seek(start)
+
+def readFileBytes(filepath, address, size):
+	with open(filepath, 'rb') as f:
+		f.seek(address)
+		return f.read(size)
+
+def getLocalFileName(path):
+	return path.replace("\\", "/").rsplit("/", 1)[-1]
+
+#Unpacks a TLOU2/TLOUP1 quantized stream: per vertex, each component with a bit size is read LSB-first and becomes bits * qScale + qOffs.
+#Positions (type 64) fill missing xyz components with qScale + qOffs. Returns little-endian float32 bytes, one float per output component
+def decodeQuantizedStream(data, numVerts, sizes, qScale, qOffs, isPosition=False):
+	components = [c for c in range(4) if sizes[c] or (isPosition and c < 3)]
+	if not components or not numVerts:
+		return b""
+	fields = readBitFields(data, [sizes[c] for c in components], numVerts)
+	if np is not None and max(sizes) <= 56:
+		output = np.empty((numVerts, len(components)), dtype=np.float64)
+		for k, c in enumerate(components):
+			output[:, k] = fields[k] * qScale[c] + qOffs[c] if sizes[c] else qScale[c] + qOffs[c]
+		return output.astype("<f4").tobytes()
+	floatsList = [0.0] * (numVerts * len(components))
+	for k, c in enumerate(components):
+		scale, offs = qScale[c], qOffs[c]
+		floatsList[k::len(components)] = [value * scale + offs for value in fields[k]] if sizes[c] else [scale + offs] * numVerts
+	return struct.pack("<" + 'f'*len(floatsList), *floatsList)
+
+#LOD index from a submesh name ending in "Shape<digit>...", 0 when there is none
+def getLODFromName(name):
+	lodFind = name.find("Shape")
+	return int(name[lodFind+5]) if lodFind != -1 and name[lodFind+5:lodFind+6].isnumeric() else 0
+
+#Bytes needed for a quantized stream of numVerts vertices
+def getQuantizedStreamSize(numVerts, sizes):
+	return (numVerts * sum(sizes) + 7) >> 3
+
+#Reads count records of LSB-first packed bit fields of the given widths, starting bitOffset bits into data.
+#Returns one sequence per field (uint64 arrays with numpy, lists of ints without or with useNumpy=False); zero-width fields read as 0
+def readBitFields(data, widths, count, bitOffset=0, useNumpy=True):
+	recordBits = sum(widths)
+	if useNumpy and np is not None and max(widths, default=0) <= 56:
+		raw = np.frombuffer(data, dtype=np.uint8, count=min(len(data), (bitOffset + count*recordBits + 7) >> 3))
+		padded = np.zeros(len(raw) + 8, dtype=np.uint8)
+		padded[:len(raw)] = raw
+		bitPos = np.arange(count, dtype=np.int64) * recordBits + bitOffset
+		fields = []
+		for width in widths:
+			if width:
+				words = padded[(bitPos >> 3)[:, None] + np.arange(8)].view("<u8").ravel()
+				fields.append((words >> (bitPos & 7).astype(np.uint64)) & np.uint64((1 << width) - 1))
+				bitPos = bitPos + width
+			else:
+				fields.append(np.zeros(count, dtype=np.uint64))
+		return fields
+	#records are read in groups that end on a byte boundary, so each group is a single int.from_bytes
+	groupSize = 8
+	while groupSize > 1 and (recordBits * (groupSize >> 1)) % 8 == 0:
+		groupSize >>= 1
+	groupBytes = (groupSize * recordBits) >> 3
+	start = bitOffset >> 3
+	numGroups = (count + groupSize - 1) // groupSize
+	groups = [int.from_bytes(data[ofs:ofs + groupBytes + 1], "little") >> (bitOffset & 7) for ofs in range(start, start + numGroups*groupBytes, groupBytes)] if groupBytes else [0] * numGroups
+	fields = []
+	fieldShift = 0
+	for width in widths:
+		mask = (1 << width) - 1
+		field = [0] * (numGroups * groupSize)
+		for k in range(groupSize):
+			shift = k*recordBits + fieldShift
+			field[k::groupSize] = [(bits >> shift) & mask for bits in groups]
+		del field[count:]
+		fields.append(field)
+		fieldShift += width
+	return fields
+
+#Applies a 4x3 row-vector transform (three basis rows, then the translation row) to a position buffer.
+#stride 12 is float32 xyz and stride 8 is half-float xyzw. Returns float32 xyz bytes
+def transformPositions(buffer, matrix, stride=12):
+	numVerts = len(buffer) // stride
+	if np is not None:
+		positions = np.frombuffer(buffer, dtype="<f4" if stride == 12 else "<f2", count=numVerts*(3 if stride == 12 else 4)).reshape(numVerts, 3 if stride == 12 else 4)[:, :3]
+		rows = np.asarray(matrix, dtype=np.float64)
+		return (positions.astype(np.float64) @ rows[:3] + rows[3]).astype("<f4").tobytes()
+	vertStruct = _f32x3 if stride == 12 else _f16x3
+	(r0x, r0y, r0z), (r1x, r1y, r1z), (r2x, r2y, r2z), (tx, ty, tz) = matrix
+	posList = []
+	for v in range(numVerts):
+		x, y, z = vertStruct.unpack_from(buffer, v*stride)
+		posList.extend((x*r0x + y*r1x + z*r2x + tx, x*r0y + y*r1y + z*r2y + ty, x*r0z + y*r1z + z*r2z + tz))
+	return struct.pack("<" + 'f'*len(posList), *posList)
+
+#uint32 values at an array of byte addresses in a buffer
+def gatherUInt32s(buffer, addresses):
+	if not (addresses & 3).any():
+		return np.frombuffer(buffer, dtype="<u4", count=len(buffer) >> 2)[addresses >> 2]
+	return np.frombuffer(buffer, dtype=np.uint8)[addresses[..., None] + np.arange(4)].view("<u4")[..., 0]
+
+#Decodes a skin to 12 bone ids and 12 weights per vertex, with unused slots zeroed. The map at mapOffset holds a (count, byte offset) pair per vertex.
+#Compressed weights are 32-bit words of a 22-bit weight and a 10-bit bone id (ushort ids, uint weights), uncompressed ones are (float weight, uint id) pairs (uint ids, float weights).
+#boneIdOffset is added to compressed bone ids. Returns (idsBuffer, weightsBuffer)
+def decodeSkinWeights(buffer, mapOffset, weightsOffset, numVerts, uncompressed=False, boneIdOffset=0):
+	slotSize = 8 if uncompressed else 4
+	if np is not None and numVerts:
+		vertMap = np.frombuffer(buffer, dtype="<u4", count=2*numVerts, offset=mapOffset).reshape(numVerts, 2)
+		valid = np.arange(12)[None, :] < vertMap[:, 0, None]
+		addresses = np.where(valid, weightsOffset + vertMap[:, 1, None].astype(np.int64) + np.arange(12) * slotSize, mapOffset)
+		if uncompressed:
+			weights = np.where(valid, gatherUInt32s(buffer, addresses), 0).astype("<u4").view("<f4")
+			ids = np.where(valid, gatherUInt32s(buffer, addresses + 4), 0).astype("<u4")
+		else:
+			words = gatherUInt32s(buffer, addresses)
+			weights = np.where(valid, words & 0x3FFFFF, 0).astype("<u4")
+			ids = np.where(valid, (words >> 22) + boneIdOffset, 0).astype("<u2")
+		return ids.tobytes(), weights.tobytes()
+	idsList = []
+	weightList = []
+	for v in range(numVerts):
+		count = min(_u32.unpack_from(buffer, mapOffset + 8*v)[0], 12)
+		slotsStart = weightsOffset + _u32.unpack_from(buffer, mapOffset + 8*v + 4)[0]
+		for w in range(count):
+			if uncompressed:
+				weightList.append(_f32.unpack_from(buffer, slotsStart + 8*w)[0])
+				idsList.append(_u32.unpack_from(buffer, slotsStart + 8*w + 4)[0])
+			else:
+				word = _u32.unpack_from(buffer, slotsStart + 4*w)[0]
+				weightList.append(word & 0x3FFFFF)
+				idsList.append((word >> 22) + boneIdOffset)
+		weightList.extend([0] * (12 - count))
+		idsList.extend([0] * (12 - count))
+	if uncompressed:
+		return struct.pack("<" + 'I'*len(idsList), *idsList), struct.pack("<" + 'f'*len(weightList), *weightList)
+	return struct.pack("<" + 'H'*len(idsList), *idsList), struct.pack("<" + 'I'*len(weightList), *weightList)
+
+#Pointer fixups sorted by absolute address, with the page each pointer is relative to and the file offset of that page field
+class PointerFixupTable:
+	def __init__(self, raw=b"", dataOffset=0, pageStarts=()):
+		self.addresses = array("q")
+		self.pages = array("H")
+		self.pageFieldOffsets = array("q")
+		if raw:
+			self.load(raw, dataOffset, pageStarts)
+
+	#raw is the whole table read from dataOffset, entries are (u16 page1Idx, u16 page2Idx, u32 offset in page1)
+	def load(self, raw, dataOffset, pageStarts):
+		count = len(raw) // 8
+		raw = bytes(raw[:8*count])
+		if np is not None:
+			entries = np.frombuffer(raw, dtype=[("page1", "<u2"), ("page2", "<u2"), ("offset", "<u4")])
+			addresses = np.asarray(pageStarts, dtype=np.int64)[entries["page1"]] + entries["offset"]
+			order = np.argsort(addresses, kind="stable")
+			self.addresses = array("q", addresses[order].astype(np.int64).tobytes())
+			self.pages = array("H", entries["page2"][order].astype(np.uint16).tobytes())
+			self.pageFieldOffsets = array("q", (order * 8 + dataOffset + 2).astype(np.int64).tobytes())
+		else:
+			words = array("I", raw)
+			if sys.byteorder == "big":
+				words.byteswap()
+			addresses = [pageStarts[w & 0xFFFF] + o for w, o in zip(words[0::2], words[1::2])]
+			order = sorted(range(count), key=addresses.__getitem__)
+			self.addresses = array("q", [addresses[i] for i in order])
+			self.pages = array("H", [words[2*i] >> 16 for i in order])
+			self.pageFieldOffsets = array("q", [dataOffset + 8*i + 2 for i in order])
+
+	def __len__(self):
+		return len(self.addresses)
+
+	def __contains__(self, address):
+		return self.find(address) != -1
+
+	#index of the fixup for a pointer address, -1 if the address is not a pointer. Duplicates resolve to the last entry in the file
+	def find(self, address):
+		i = bisect_right(self.addresses, address) - 1
+		if i >= 0 and self.addresses[i] == address:
+			return i
+		return -1
+
+	def getPage(self, address):
+		i = self.find(address)
+		return self.pages[i] if i != -1 else None
+
+	#getPage for a whole list of pointer addresses
+	def getPages(self, addresses):
+		if np is None or not len(self.addresses):
+			return [self.getPage(address) for address in addresses]
+		table = np.frombuffer(self.addresses, dtype=np.int64)
+		query = np.asarray(addresses, dtype=np.int64)
+		found = np.maximum(np.searchsorted(table, query, side="right") - 1, 0)
+		pages = np.frombuffer(self.pages, dtype=np.uint16)[found].tolist()
+		return [page if isPointer else None for page, isPointer in zip(pages, (table[found] == query).tolist())]
+
+#Keeps the most recently read files open, closing the least recently used one past maxOpen
+class FileHandlePool:
+	def __init__(self, maxOpen=8):
+		self.maxOpen = maxOpen
+		self.files = OrderedDict()
+
+	def read(self, path, address, size):
+		f = self.files.pop(path, None)
+		if f is None:
+			if len(self.files) >= self.maxOpen:
+				self.files.popitem(last=False)[1].close()
+			f = open(path, "rb")
+		self.files[path] = f
+		f.seek(address)
+		return f.read(size)
+
+	def close(self):
+		for f in self.files.values():
+			f.close()
+		self.files.clear()
+
+#Raw-data start of a pak: the end of its last page, read from the page entry table
+def readRawDataStart(path):
+	with open(path, "rb") as f:
+		f.seek(16)
+		pageCt, pageEntriesOffs = struct.unpack("<2I", f.read(8))
+		f.seek(pageEntriesOffs + 12*(pageCt-1))
+		pageStart, pageSize = struct.unpack("<2I", f.read(8))
+	return pageStart + pageSize
+
+#Raw-data starts missing from the texture hash index, read from the dict the first time one of its textures is loaded
+class TextureHashLookup:
+	def __init__(self):
+		self.rawDataStarts = {}
+
+	def getRawDataStart(self, location, dictPath):
+		if location.rawDataStart is not None:
+			return location.rawDataStart
+		key = (location.world, location.dictFile)
+		if key not in self.rawDataStarts:
+			self.rawDataStarts[key] = readRawDataStart(dictPath)
+		return self.rawDataStarts[key]
+
+#Every texture hash of a game's global/world texture dicts mapped to where its VRAM desc is, so a lookup is one dict probe
+class TextureHashIndex(TextureHashLookup):
+	def __init__(self):
+		TextureHashLookup.__init__(self)
+		self.locations = {}
+		self.alternates = {} #further locations of hashes listed by more than one dict file
+
+	def __len__(self):
+		return len(self.locations)
+
+	def __contains__(self, texHash):
+		return texHash in self.locations
+
+	def add(self, texHash, location):
+		if texHash in self.locations:
+			self.alternates.setdefault(texHash, []).append(location)
+		else:
+			self.locations[texHash] = location
+
+	#All locations of a texture hash, in the order the dicts were indexed
+	def find(self, texHash):
+		location = self.locations.get(texHash)
+		if location is None:
+			return []
+		return [location] + self.alternates.get(texHash, [])
+
+	def items(self):
+		for texHash, location in self.locations.items():
+			yield texHash, location
+			for alternate in self.alternates.get(texHash, ()):
+				yield texHash, alternate
+
+	#gameDicts is one game's entry of NDTextureHashes.json: {world: {dictFile: {hash: entry}}} when hasWorlds (TLOU2/TLOUP1), else {dictFile: {hash: entry}}.
+	#entry is [offset] + TextureDictVram fields, or just the offset in older dumps.
+	#rawDataStarts has the same world/dictFile nesting, with world "All" for U4/TLL. Dicts it does not list get theirs from getRawDataStart
+	@classmethod
+	def fromHashDicts(cls, gameDicts, hasWorlds, rawDataStarts=None):
+		index = cls()
+		rawDataStarts = rawDataStarts or {}
+		for world, dictFiles in (gameDicts.items() if hasWorlds else [("All", gameDicts)]):
+			worldStarts = rawDataStarts.get(world) or {}
+			for dictFile, hashes in dictFiles.items():
+				rawDataStart = worldStarts.get(dictFile)
+				for texHash, entry in hashes.items():
+					if isinstance(entry, list):
+						index.add(int(texHash), TextureLocation(world, dictFile, entry[0], rawDataStart, TextureDictVram(*entry[1:])))
+					else:
+						index.add(int(texHash), TextureLocation(world, dictFile, entry, rawDataStart, None))
+		return index
+
+	#{game: index} for the whole NDTextureHashes.json, rawDataStarts is {game: {world: {dictFile: rawDataStart}}}
+	@classmethod
+	def fromHashJson(cls, texDicts, rawDataStarts=None):
+		rawDataStarts = rawDataStarts or {}
+		return dict((gameName, cls.fromHashDicts(gameDicts, gameName == "TLOU2" or gameName == "TLOUP1", rawDataStarts.get(gameName))) for gameName, gameDicts in texDicts.items()
+			if not gameName.endswith(".pak")) #older dumps put U4/TLL dicts at the top level
+
+#One game of a TextureHashDB, binary searched in place
+class TextureHashTable(TextureHashLookup):
+	def __init__(self, buf, hashCount, dicts, hashesOffs, offsetsOffs, dictIdsOffs, vramsOffs):
+		TextureHashLookup.__init__(self)
+		self.buf = buf
+		self.hashCount = hashCount
+		self.dicts = dicts #(world, dictFile, rawDataStart) per dict id
+		self.hashesOffs = hashesOffs
+		self.offsetsOffs = offsetsOffs
+		self.dictIdsOffs = dictIdsOffs
+		self.vramsOffs = vramsOffs
+
+	def __len__(self):
+		return self.hashCount
+
+	def __contains__(self, texHash):
+		i = self.lowerBound(texHash)
+		return i < self.hashCount and _u64.unpack_from(self.buf, self.hashesOffs + 8*i)[0] == texHash
+
+	def lowerBound(self, texHash):
+		lo, hi = 0, self.hashCount
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if _u64.unpack_from(self.buf, self.hashesOffs + 8*mid)[0] < texHash:
+				lo = mid + 1
+			else:
+				hi = mid
+		return lo
+
+	#Same results as TextureHashIndex.find
+	def find(self, texHash):
+		locations = []
+		i = self.lowerBound(texHash)
+		while i < self.hashCount and _u64.unpack_from(self.buf, self.hashesOffs + 8*i)[0] == texHash:
+			world, dictFile, rawDataStart = self.dicts[_u16.unpack_from(self.buf, self.dictIdsOffs + 2*i)[0]]
+			vram = TextureDictVram(*_texDBVram.unpack_from(self.buf, self.vramsOffs + _texDBVram.size*i))
+			locations.append(TextureLocation(world, dictFile, _u32.unpack_from(self.buf, self.offsetsOffs + 4*i)[0], rawDataStart, vram if vram.vramSize else None))
+			i += 1
+		return locations
+
+#Memory-mapped NDTextureHashes.bin, written by writeTextureHashDB. Only the dict tables are read up front
+class TextureHashDB:
+	def __init__(self, buf=b""):
+		self.buf = buf
+		self.games = {}
+		if buf:
+			self.load()
+
+	@classmethod
+	def open(cls, path):
+		with open(path, "rb") as f:
+			buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			return cls(buf)
+		except Exception:
+			buf.close()
+			raise
+
+	def close(self):
+		self.games = {}
+		if isinstance(self.buf, mmap.mmap):
+			self.buf.close()
+
+	def load(self):
+		buf = self.buf
+		magic, version, gameCount = _texDBHeader.unpack_from(buf, 0)
+		if magic != TextureHashDBMagic or version != TextureHashDBVersion:
+			raise ValueError("Unsupported texture hash database version")
+		for i in range(gameCount):
+			name, hashCount, dictCount, dictsOffs, hashesOffs, offsetsOffs, dictIdsOffs, vramsOffs = _texDBGame.unpack_from(buf, _texDBHeader.size + _texDBGame.size*i)
+			dicts = []
+			for j in range(dictCount):
+				rawDataStart, worldLen, fileLen = _texDBDict.unpack_from(buf, dictsOffs)
+				dictsOffs += _texDBDict.size
+				world = bytes(buf[dictsOffs:dictsOffs+worldLen]).decode("utf-8")
+				dictFile = bytes(buf[dictsOffs+worldLen:dictsOffs+worldLen+fileLen]).decode("utf-8")
+				dictsOffs += worldLen + fileLen
+				dicts.append((world, dictFile, rawDataStart or None))
+			self.games[name.rstrip(b"\0").decode("utf-8")] = TextureHashTable(buf, hashCount, dicts, hashesOffs, offsetsOffs, dictIdsOffs, vramsOffs)
+
+#Writes {game: TextureHashIndex} as a TextureHashDB file. Returns the number of hashes written
+def writeTextureHashDB(path, indexes):
+	start = _texDBHeader.size + _texDBGame.size*len(indexes)
+	header = bytearray(_texDBHeader.pack(TextureHashDBMagic, TextureHashDBVersion, len(indexes)))
+	body = bytearray()
+	total = 0
+	for gameName, index in indexes.items():
+		dictIds = {}
+		dicts = bytearray()
+		entries = []
+		for texHash, location in index.items():
+			key = (location.world, location.dictFile)
+			if key not in dictIds:
+				dictIds[key] = len(dictIds)
+				world, dictFile = location.world.encode("utf-8"), location.dictFile.encode("utf-8")
+				dicts += _texDBDict.pack(location.rawDataStart or 0, len(world), len(dictFile)) + world + dictFile
+			entries.append((texHash, location.offset, dictIds[key], location.vram or (0, 0, 0, 0, 0)))
+		entries.sort(key=lambda entry: entry[0]) #stable, so repeated hashes keep their lookup order
+		offsets = []
+		for section in (dicts, struct.pack("<%dQ" % len(entries), *[e[0] for e in entries]), struct.pack("<%dI" % len(entries), *[e[1] for e in entries]), struct.pack("<%dH" % len(entries), *[e[2] for e in entries]), b"".join(_texDBVram.pack(*e[3]) for e in entries)):
+			body += bytes(-(start + len(body)) % 8)
+			offsets.append(start + len(body))
+			body += section
+		header += _texDBGame.pack(gameName.encode("utf-8"), len(entries), len(dictIds), *offsets)
+		total += len(entries)
+	with open(path + ".tmp", "wb") as f:
+		f.write(header)
+		f.write(body)
+	os.replace(path + ".tmp", path)
+	return total
+
+#NDTextureHashes.json -> NDTextureHashes.bin
+def convertTextureHashJson(jsonPath, dbPath, rawDataStarts=None):
+	with open(jsonPath) as f:
+		texDicts = json.load(f)
+	return writeTextureHashDB(dbPath, TextureHashIndex.fromHashJson(texDicts, rawDataStarts))
+
+#Settings for reading paks, shared by every pak of a load. fmt_nd_pak extends this with its dialog options
+class PakOptions:
+	def __init__(self):
+		self.texoutExt = ".dds"
+		self.cacheDir = None #folder for parse caches, None to always parse
+
+class PakSubmesh:
+	__slots__ = ("name", "numVerts", "numIndices", "streamDescs", "skinDesc", "nrmRecalcDesc", "streamsAddr", "facesOffset", "facesOffsetAddr", "bbox", "offset", "material", "lod")
+
+	def __init__(self, name=None, numVerts=None, numIndices=None, facesOffset=None, streamDescs=None, skinDesc=None, nrmRecalcDesc=None, streamsAddr=None, facesOffsetAddr=None, offset=None, material=None, lod=0):
+		self.name = name
+		self.numVerts = numVerts
+		self.numIndices = numIndices
+		self.streamDescs = streamDescs
+		self.skinDesc = skinDesc
+		self.nrmRecalcDesc = nrmRecalcDesc
+		self.streamsAddr = streamsAddr
+		self.facesOffset = facesOffset
+		self.facesOffsetAddr = facesOffsetAddr
+		self.bbox = ()
+		self.offset = offset
+		self.material = material
+		self.lod = lod
+
+#Texture found in a pak's VRAM_DESC ResItems. extraTextures holds the placeholder textures and channel copies made from it by the plugin
+class VramEntry:
+	__slots__ = ("offset", "name", "extraTextures")
+
+	def __init__(self, offset, name, extraTextures=None):
+		self.offset = offset
+		self.name = name
+		self.extraTextures = extraTextures or []
+
+def openPak(path, args=None):
+	args = dict(args or {})
+	args["path"] = path
+	return PakReader(PakStream.fromFile(path), args)
+
+#Header-only scan: reads the header, page table, page headers and ResItem headers, never the geometry or texture data. game is the pak layout, "U4" also covers TLL
+def scanPak(path, args=None):
+	pak = openPak(path, args)
+	try:
+		if not pak.readPakHeader():
+			return None
+		numSubmeshes = 0
+		if pak.geoOffset:
+			numSubmeshes = readUIntAt(pak.bs, pak.geoOffset[0] + pak.geoOffset[1] + pak.resItemPaddingSz + 8)
+		return PakSummary(path=path, game="TLOUP1" if pak.isTLOUP1 else "TLOU2" if pak.isTLOU2 else "U4", pageCount=len(pak.pakPageEntries),
+			resItemTypes=dict((itemType, len(items)) for itemType, items in pak.resItems.items()), numSubmeshes=numSubmeshes,
+			hasSkeleton=pak.jointOffset != None, needsBasePak=pak.needsBasePak, vramHashes=list(pak.vrams))
+	finally:
+		pak.bs.close()
+
+#scanPak for every .pak under a folder
+def scanPakTree(root, args=None):
+	for folder, subFolders, fileNames in os.walk(root):
+		for fileName in sorted(fileNames):
+			if fileName.lower().endswith(".pak"):
+				try:
+					summary = scanPak(os.path.join(folder, fileName), args)
+				except Exception as e:
+					print("Failed to scan", os.path.join(folder, fileName), e)
+					continue
+				if summary:
+					yield summary
+
+#Header-only read of one global/world texture dict, None if it is not a pak
+def scanTextureDict(path):
+	stat = os.stat(path)
+	pak = openPak(path)
+	try:
+		if not pak.readPakHeader(["VRAM_DESC"]):
+			return None
+		buf = pak.bs.getBuffer()
+		hashes = {}
+		for texHash, vram in pak.vrams.items():
+			dataOffset, vramSize, imgFormat, width, height = _vramDescFields.unpack_from(buf, vram.offset + 40)
+			hashes[str(texHash)] = [vram.offset, dataOffset, vramSize, width, height, imgFormat]
+		return TextureDictScan(size=stat.st_size, mtime=stat.st_mtime_ns, rawDataStart=pak.getRawDataStart(), hashes=hashes)
+	except Exception as e:
+		print("Failed to scan", path, e)
+		return None
+	finally:
+		pak.bs.close()
+
+class PakReader:
+
+	#Attributes saved to the parse cache after readPakHeader and readPak
+	cacheHeaderAttrs = ("pakPageEntries", "pointerFixups", "pakLoginTable", "entriesList", "resItems", "vrams", "vramNames", "jointOffset", "geoOffset", "needsBasePak")
+	cachePakAttrs = ("joints", "jointsInfo", "submeshes", "materials", "xforms", "lods")
+
+	def __init__(self, bs, args={}):
+		self.bs = bs
+		self.args = args
+		self.options = args.get("options") or PakOptions()
+		self.path = args.get("path")
+		#format of this pak, detected by readPakHeader. Kept per reader so paks of different games can be read side by side
+		self.isTLOU2 = False
+		self.isTLOUP1 = False
+		self.resItemPaddingSz = 32
+		self.cacheState = None #parse cache of this pak: None before it is looked up, then 0 unusable, 1 header only, 2 header and pak
+		self.pakPageEntries = []
+		self.pointerFixups = PointerFixupTable()
+		self.entriesList = []
+		self.resItems = {}
+		self.strings = {}
+		self.pakLoginTable = []
+		self.submeshes = []
+		self.materials = {}
+		self.lods = args.get("lods") or []
+		self.xforms = {}
+		self.vrams = {}
+		self.vramNames = {}
+		self.joints = None
+		self.jointsInfo = None
+		self.jointOffset = None
+		self.geoOffset = None
+		self.needsBasePak = False
+
+	def getPointerFixupPage(self, readAddr):
+		return self.pointerFixups.getPage(readAddr)
+
+	def changePointerFixup(self, address, newOffset, newPage):
+		i = self.pointerFixups.find(address)
+		if i != -1:
+			returnAddr = self.bs.tell()
+			writeUIntAt(self.bs, address, newOffset+20)
+			self.bs.seek(self.pointerFixups.pageFieldOffsets[i])
+			self.bs.writeUShort(newPage)
+			self.bs.seek(returnAddr)
+
+	def readPointerFixup(self, TP1ZeroCondition=False):
+		bs = self.bs
+		readAddr = bs.tell()
+		offset = bs.readInt64()
+		if offset > 0 or TP1ZeroCondition:
+			pageId = self.getPointerFixupPage(readAddr)
+			if pageId != None:
+				return offset + self.pakPageEntries[pageId][0]
+			if not TP1ZeroCondition:
+				print("ReadAddr not found in PointerFixups!", readAddr)
+				raise ValueError("ReadAddr " + str(readAddr) + " not found in PointerFixups! This file may be broken")
+		return offset
+
+	#Cached and interned readStringAt. Names, types and texture paths are shared by many ResItems, submeshes and materials
+	def readStringAt(self, offset):
+		output = self.strings.get(offset)
+		if output is None:
+			output = self.strings[offset] = sys.intern(readStringAt(self.bs, offset))
+		return output
+
+	#readStringAt for many offsets. Strings that sit close together (like a name table) are decoded from one block read
+	def readStrings(self, offsets):
+		strings = self.strings
+		missing = [offset for offset in offsets if offset not in strings]
+		if len(missing) > 1:
+			first = min(missing)
+			last = max(missing)
+			if last - first <= 64*len(missing) + 4096:
+				bs = self.bs
+				returnAddr = bs.tell()
+				bs.seek(first)
+				block = bs.readBytes(last - first)
+				bs.seek(returnAddr)
+				pos = 0
+				end = block.find(b"\0")
+				while end != -1:
+					if first + pos not in strings:
+						strings[first + pos] = sys.intern(block[pos:end].decode("utf-8", "replace"))
+					pos = end + 1
+					end = block.find(b"\0", pos)
+		return [self.readStringAt(offset) for offset in offsets]
+
+	#readUInt64 at many addresses, gathered straight from the buffer when the pak is a PakStream
+	def readUInt64s(self, addresses):
+		if not isinstance(self.bs, PakStream):
+			return [readUInt64At(self.bs, address) for address in addresses]
+		if np is not None and len(addresses) > 1:
+			data = np.frombuffer(self.bs.getBuffer(), dtype=np.uint8)
+			gathered = data[np.asarray(addresses, dtype=np.int64)[:, None] + np.arange(8)]
+			return gathered.view("<u8").ravel().tolist()
+		buf = self.bs.getBuffer()
+		return [_u64.unpack_from(buf, address)[0] for address in addresses]
+
+	#Bone ids and weights of a skinned submesh, see decodeSkinWeights
+	def readSkinWeights(self, submesh, boneIdOffset=0):
+		skinDesc = submesh.skinDesc
+		return decodeSkinWeights(self.bs.getBuffer(), skinDesc.mapOffset, skinDesc.weightsOffset, submesh.numVerts, skinDesc.uncompressed, boneIdOffset)
+
+	#Decodes one submesh at a time, so callers can drop each one before the next is read. Submeshes above maxLOD (or not in indices) are skipped without reading them.
+	#boneIds/boneWeights are None unless readSkin is set, see decodeSkinWeights for their layout. indices are "<u2" triangles.
+	#views: raw vertex streams and indices are memoryview slices of the pak (see PakStream.readView) instead of copies, for headless consumers
+	def iterSubmeshes(self, maxLOD=None, readSkin=True, boneIdOffset=0, indices=None, views=False):
+		bs = self.bs
+		isT2 = self.isTLOU2 or self.isTLOUP1
+		readBytes = bs.readView if views else bs.readBytes
+		for i in range(len(self.submeshes)) if indices is None else indices:
+			sm = self.submeshes[i]
+			if maxLOD is not None and sm.lod > maxLOD:
+				continue
+			streams = []
+			foundUVs = foundNormals = foundColors = 0
+			for j, sd in enumerate(sm.streamDescs):
+				bs.seek(sd.offset)
+				if isT2:
+					if j == 0 and sd.stride == 12:
+						streams.append(VertexStream("position", 0, "<f4", 12, readBytes(12 * sm.numVerts)))
+					elif sd.type in (1, 11):
+						streams.append(VertexStream("uv", 0 if sd.type == 1 else 1, "<f2", 4, readBytes(4 * sm.numVerts)))
+					elif sd.type in (2, 3):
+						streams.append(VertexStream("normal" if sd.type == 2 else "tangent", 0, "i1", 4, readBytes(4 * sm.numVerts)))
+					else:
+						with bs.readView(getQuantizedStreamSize(sd.numVerts, sd.sizes)) as packed:
+							floatsBuffer = decodeQuantizedStream(packed, sd.numVerts, sd.sizes, sd.qScale, sd.qOffs, sd.type == 64)
+						if floatsBuffer:
+							if sd.type == 64:
+								streams.append(VertexStream("position", 0, "<f4", 12, floatsBuffer))
+							elif sd.type in (65, 75, 76):
+								streams.append(VertexStream("uv", (65, 75, 76).index(sd.type), "<f4", 8, floatsBuffer))
+							else:
+								print("Buffer type not read:", sd.type)
+				else:
+					#Positions
+					if j == 0:
+						streams.append(VertexStream("position", 0, "<f4" if sd.stride == 12 else "<f2", sd.stride, readBytes(sd.stride * sm.numVerts)))
+					#UVs
+					elif sd.type == 34:
+						streams.append(VertexStream("uv", foundUVs, "<f2", 4, readBytes(4 * sm.numVerts)))
+						foundUVs += 1
+					#Normals/Tangents
+					elif sd.type == 31 and foundNormals != 2:
+						streams.append(VertexStream("normal" if foundNormals == 0 else "tangent", 0, "i1", 4, readBytes(4 * sm.numVerts)))
+						foundNormals += 1
+					#Extra vec4 halfs
+					elif sd.type == 10:
+						streams.append(VertexStream("color", foundColors, "<f2", 8, readBytes(8 * sm.numVerts)))
+						foundColors += 1
+					else:
+						print("Omitting vertex component type", sd.type, "found at", bs.tell())
+			boneIds = boneWeights = None
+			if readSkin and sm.skinDesc:
+				boneIds, boneWeights = self.readSkinWeights(sm, boneIdOffset)
+			bs.seek(sm.facesOffset)
+			material = self.materials.get(sm.material)
+			yield DecodedSubmesh(i, sm, sm.name, material.name if material else None, sm.lod, sm.numVerts, streams, boneIds, boneWeights, readBytes(2 * sm.numIndices))
+
+	#iterSubmeshes sharded over a process pool, each worker mapping the pak file itself. Returns the decoded submeshes in submesh order.
+	#Needs a pak opened from a path and a real interpreter to spawn workers (not Noesis), otherwise decodes serially
+	def decodeSubmeshesParallel(self, maxLOD=None, readSkin=True, boneIdOffset=0, workers=None):
+		indices = [i for i, sm in enumerate(self.submeshes) if maxLOD is None or sm.lod <= maxLOD]
+		workers = min(workers or os.cpu_count() or 1, len(indices))
+		if workers < 2 or not self.path:
+			return list(self.iterSubmeshes(maxLOD, readSkin, boneIdOffset))
+		#contiguous shards of similar vertex counts, a few per worker so one heavy shard does not stall the pool
+		numShards = min(len(indices), workers * 4)
+		shardVerts = sum(self.submeshes[i].numVerts for i in indices) / numShards
+		shards = [[]]
+		vertCount = 0
+		for i in indices:
+			if vertCount >= shardVerts and len(shards) < numShards:
+				shards.append([])
+				vertCount = 0
+			shards[-1].append(i)
+			vertCount += self.submeshes[i].numVerts
+		from concurrent.futures import ProcessPoolExecutor
+		#each task carries only its own submeshes and the materials they use, so pickling stays proportional to the shard
+		tasks = []
+		for shard in shards:
+			submeshes = [self.submeshes[i] for i in shard]
+			materials = dict((sm.material, self.materials[sm.material]) for sm in submeshes if sm.material in self.materials)
+			tasks.append((self.path, (self.isTLOU2, self.isTLOUP1), submeshes, materials, shard, readSkin, boneIdOffset))
+		with ProcessPoolExecutor(workers) as pool:
+			return [decoded for shardOutput in pool.map(decodeSubmeshShard, tasks) for decoded in shardOutput]
+
+	#readPointerFixup for a column of already-read offsets and the addresses they were read from
+	def resolvePointers(self, readAddrs, offsets, TP1ZeroCondition=False):
+		output = []
+		for readAddr, offset, pageId in zip(readAddrs, offsets, self.pointerFixups.getPages(readAddrs)):
+			if offset > 0 or TP1ZeroCondition:
+				if pageId != None:
+					offset += self.pakPageEntries[pageId][0]
+				elif not TP1ZeroCondition:
+					print("ReadAddr not found in PointerFixups!", readAddr)
+					raise ValueError("ReadAddr " + str(readAddr) + " not found in PointerFixups! This file may be broken")
+			output.append(offset)
+		return output
+
+	#One placement per transform referencing this submesh, empty if the submesh is not instanced. Matrices are 4x4 rows, translation in the last row
+	def getSubmeshInstances(self, submesh):
+		return [MeshInstance(submesh.name + "#" + str(i), xform) for i, xform in enumerate(self.xforms.get(submesh.offset) or [])]
+
+	#Unique geometry with its placements: (DecodedSubmesh, getSubmeshInstances list) per submesh, the geometry left untransformed
+	def iterInstancedSubmeshes(self, maxLOD=None, readSkin=True, boneIdOffset=0, views=False):
+		for decoded in self.iterSubmeshes(maxLOD, readSkin, boneIdOffset, views=views):
+			yield decoded, self.getSubmeshInstances(decoded.submesh)
+	
+	def getRawDataStart(self):
+		return self.pakPageEntries[len(self.pakPageEntries)-1][0] + self.pakPageEntries[len(self.pakPageEntries)-1][1]
+
+	def makeVramHashJson(self, jsons):
+		fileName = getLocalFileName(self.path)
+		jsons[fileName] = {}
+		for hash, vram in self.vrams.items():
+			jsons[fileName][hash] = vram.offset
+
+	def readVramDesc(self, vramOffset=0):
+		bs = self.bs
+		vramOffset = vramOffset or bs.tell()
+		bs.seek(vramOffset + 40)
+		pakOffset = bs.readUInt()
+		unknown0 = bs.readUInt()
+		vramSize = bs.readUInt()
+		textureDictId = bs.readUInt()
+		m_hash = bs.readUInt64()
+		unknown1 = bs.readUInt()
+		m_type = bs.readUInt()
+		imgFormat = bs.readUInt()
+		field_2C = bs.readUInt()
+		m_mipCount = bs.readUInt()
+		width = bs.readUInt()
+		height = bs.readUInt()
+		field_3C = bs.readUInt()
+		m_streamFlags = bs.readUInt()
+		texPath = self.readStringAt(bs.tell()+12)
+		return VramDesc(pakOffset=pakOffset, vramSize=vramSize, textureDictId=textureDictId, hash=m_hash, type=m_type, imgFormat=imgFormat,
+			mipCount=m_mipCount, width=width, height=height, streamFlags=m_streamFlags, path=texPath)
+
+	def checkResItem(self, start, m_resItemOffset, m_itemType):
+		bs = self.bs
+		self.entriesList.append(PakEntry(type=m_itemType, offset = m_resItemOffset))
+
+		if m_itemType == "VRAM_DESC":
+			self.readVramDescs([PakResItem(m_itemType, start, m_resItemOffset)])
+
+		if m_itemType == "JOINT_HIERARCHY":
+			self.jointOffset = (m_resItemOffset, start)
+
+		if m_itemType == "GEOMETRY_1":
+			self.geoOffset = (m_resItemOffset, start)
+			m_numSubMeshDesc = readUIntAt(bs, self.geoOffset[0] + self.geoOffset[1] + self.resItemPaddingSz + 8)
+			bs.seek(self.geoOffset[0] + self.geoOffset[1] + self.resItemPaddingSz + 40)
+			SubmeshesOffs = self.readPointerFixup()
+			bs.seek(SubmeshesOffs)
+			submeshTable = bs.readBytes(176*m_numSubMeshDesc)
+			self.needsBasePak = self.needsBasePak or any(_u64.unpack_from(submeshTable, 176*i + 104)[0] for i in range(m_numSubMeshDesc))
+
+	#Cache file for this pak, named after its path so paks with the same name in different folders do not collide
+	def getCachePath(self):
+		if self.options.cacheDir and self.path and os.path.isfile(self.path):
+			path = os.path.abspath(self.path)
+			return os.path.join(self.options.cacheDir, getLocalFileName(path) + "_%08x.ndpc" % zlib.crc32(path.lower().encode("utf-8")))
+
+	#texoutExt is part of the cached texture names
+	def getCacheKey(self):
+		stat = os.stat(self.path)
+		return (os.path.abspath(self.path), stat.st_size, stat.st_mtime_ns, self.options.texoutExt)
+
+	#The cache file is only read once per reader; later calls reuse what it held
+	def loadCache(self, needsPak=False):
+		if self.cacheState is None:
+			self.cacheState = self.readCacheFile()
+		return 1 if self.cacheState == 2 or (self.cacheState == 1 and not needsPak) else 0
+
+	def readCacheFile(self):
+
+		cachePath = self.getCachePath()
+		if not cachePath or not os.path.isfile(cachePath):
+			return 0
+		try:
+			with open(cachePath, "rb") as f:
+				cache = pickle.load(f)
+		except Exception as e:
+			print("Failed to read parse cache", cachePath, e)
+			return 0
+		if cache.get("version") != PakCacheVersion or cache.get("key") != self.getCacheKey():
+			return 0
+		self.isTLOU2, self.isTLOUP1, self.resItemPaddingSz = cache["flags"]
+		for name, value in cache["header"].items():
+			setattr(self, name, value)
+		for name, value in (cache.get("pak") or {}).items():
+			setattr(self, name, value)
+		print("Loaded cached", self.path)
+		return 2 if "pak" in cache else 1
+
+	def saveCache(self, hasPak=False):
+		cachePath = self.getCachePath()
+		if not cachePath:
+			return 0
+		cache = {
+			"version": PakCacheVersion,
+			"key": self.getCacheKey(),
+			"flags": (self.isTLOU2, self.isTLOUP1, self.resItemPaddingSz),
+			"header": dict((name, getattr(self, name)) for name in self.cacheHeaderAttrs),
+		}
+		cache["header"]["vrams"] = dict((texHash, VramEntry(vram.offset, vram.name)) for texHash, vram in self.vrams.items()) #drop anything attached to the textures after parsing
+		if hasPak:
+			cache["pak"] = dict((name, getattr(self, name)) for name in self.cachePakAttrs)
+		try:
+			if not os.path.isdir(self.options.cacheDir):
+				os.makedirs(self.options.cacheDir)
+			with open(cachePath + ".tmp", "wb") as f:
+				pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+			os.replace(cachePath + ".tmp", cachePath)
+		except Exception as e:
+			print("Failed to write parse cache", cachePath, e)
+			return 0
+		self.cacheState = 2 if hasPak else max(self.cacheState or 0, 1)
+		return 1
+
+	#Adds VRAM_DESC ResItems to self.vrams in one pass. Returns the descriptor addresses, texture hashes and texture names (None if not added)
+	def readVramDescs(self, resItems):
+		descStart = 16 if self.isTLOU2 else 0
+		descAddrs = [resItem.start + resItem.offset + descStart for resItem in resItems]
+		texHashes = self.readUInt64s([descAddr + 56 for descAddr in descAddrs])
+		texPaths = self.readStrings([descAddr + 112 for descAddr in descAddrs])
+		texNames = []
+		for descAddr, texHash, texPath in zip(descAddrs, texHashes, texPaths):
+			delimiter = ".exr/" if ".exr/" in texPath else ".tga/"
+			splitted = getLocalFileName(texPath.replace(delimiter, "+")).split("+", 1)
+			texName = splitted[0] + self.options.texoutExt
+			if len(splitted) > 1:
+				if texName in self.vramNames:
+					texName = (splitted[0] + "_" + splitted[1]).replace(".ndb", self.options.texoutExt) #add hash to duplicate texture names
+				self.vramNames[texName] = True
+				self.vrams[texHash] = VramEntry(descAddr, texName)
+				texNames.append(texName)
+			else:
+				texNames.append(None)
+		return descAddrs, texHashes, texNames
+
+	def readPakHeader(self, itemTypes=None):
+
+		print ("Reading", self.path)
+		if self.loadCache():
+			return 1
+
+		bs = self.bs
+		bs.seek(0)
+		m_magic = bs.readUInt() if bs.getSize() >= 64 else 0	#0x0 0x00000A79
+		if m_magic != 2681 and m_magic != 68217 and m_magic != 2147486329 and m_magic != 2685 and m_magic != 68221:
+			print("No pak header detected!", m_magic)
+			return 0
+		self.isTLOUP1 = (m_magic == 2685 or m_magic == 68221)
+
+		m_hdrSize = bs.readUInt()					#0x4 header size
+		m_pakLoginTableIdx = bs.readUInt()			#0x8 idx of the page storing the PakLoginTable
+		m_pakLoginTableOffset = bs.readUInt()		#0xC relative offset PakLoginTable = PakPageHeader + m_pakLoginTableOffset; //its a ResItem
+		m_pageCt = bs.readUInt()					#0x10 page count. Total number of pages in the package
+		m_pPakPageEntryTable = bs.readUInt()		#0x14 ptr to the PakPageEntry array/table
+		m_numPointerFixUpPages = bs.readUInt()		#0x18 always 0x8
+		m_pointerFixUpTableOffset = bs.readUInt()	#0x1C ptr to the PointerFixUpTable table
+		m_unk5 = bs.readUInt()						#0x20 no idea
+		m_unk6 = bs.readUInt()						#0x20 no idea
+		m_unk7 = bs.readUInt()						#0x20 no idea
+		if self.isTLOUP1:
+			m_unk8 = bs.readUInt()
+			m_unk9 = bs.readUInt()
+			m_unk10 = bs.readUInt()
+
+		bs.seek(m_pPakPageEntryTable)
+		self.pakPageEntries = []
+		for i in range(m_pageCt):
+			self.pakPageEntries.append((bs.readUInt(), bs.readUInt(), bs.readUInt()))
+
+		bs.seek(m_pointerFixUpTableOffset)
+		m_pageEntryNumber = bs.readUInt()
+		m_dataOffset = bs.readUInt()
+		m_numLoginPageEntries = bs.readUInt()
+		bs.seek(m_dataOffset)
+		self.pointerFixups = PointerFixupTable(bs.readBytes(8*m_numLoginPageEntries), m_dataOffset, [pageEntry[0] for pageEntry in self.pakPageEntries])
+
+		self.jointOffset = self.geoOffset = None
+		self.vrams = {}
+		self.pakLoginTable = []
+		self.vramNames = {}
+
+		pakLoginTableItemStart = self.pakPageEntries[m_pakLoginTableIdx][0] + m_pakLoginTableOffset
+		self.isTLOU2 = (readUIntAt(bs, pakLoginTableItemStart+32) == 74565)
+		self.resItemPaddingSz = 48 if (self.isTLOU2 or self.isTLOUP1) else 32
+		bs.seek(pakLoginTableItemStart + self.resItemPaddingSz)
+		loginCount = bs.readUInt()
+		bs.seek(4, 1)
+
+		for i in range(loginCount):
+			self.pakLoginTable.append(PakLoginTableEntry(page=bs.readUInt(), offset=bs.readUInt()))
+
+		self.resItems = {}
+		vramItems = []
+		for resItem in self.iterResItems(itemTypes):
+			self.resItems[resItem.type] = self.resItems.get(resItem.type) or []
+			self.resItems[resItem.type].append(resItem)
+			if resItem.type == "VRAM_DESC": #read together after the walk
+				self.entriesList.append(PakEntry(type=resItem.type, offset=resItem.offset))
+				vramItems.append(resItem)
+			else:
+				self.checkResItem(resItem.start, resItem.offset, resItem.type)
+		self.readVramDescs(vramItems)
+		if itemTypes is None:
+			self.saveCache()
+		return 1
+
+	#Yields the ResItems of the given types (all known types if None) as they are found, without reading anything else about them
+	def iterResItems(self, itemTypes=None):
+		bs = self.bs
+		if self.isTLOUP1: #the outer pak format was changed a lot for TLOU Part I. ResPage and ResPageEntry are gone, now all ResItems are accessed from the pak login table and have StringIDs for names
+			for loginResItem in self.pakLoginTable:
+				start = self.pakPageEntries[loginResItem.page][0]
+				m_itemType = TP1_pakStringIDs.get(readUInt64At(bs, start + loginResItem.offset + 32))
+				if not m_itemType:
+					continue
+				if itemTypes is None or m_itemType in itemTypes:
+					yield PakResItem(m_itemType, start, loginResItem.offset)
+				if (m_itemType == "TEXTURE_TABLE" or m_itemType == "TEXTURE_DICTIONARY") and (itemTypes is None or "VRAM_DESC" in itemTypes):
+					for resItem in self.iterTextureTable(start + loginResItem.offset):
+						yield resItem
+		else:
+			for pageEntry in self.pakPageEntries:
+				start = pageEntry[0]
+				m_numPageHeaderEntries = readUShortAt(bs, start + 18)
+				for ph in range(m_numPageHeaderEntries):
+					m_resItemOffset = readUIntAt(bs, start + 20 + 16*ph + 8)
+					m_itemType = self.readStringAt(readUInt64At(bs, m_resItemOffset + start + 8) + start)
+					if itemTypes is None or m_itemType in itemTypes:
+						yield PakResItem(m_itemType, start, m_resItemOffset)
+
+	#VRAM_DESC ResItems listed by a TLOUP1 TEXTURE_TABLE or TEXTURE_DICTIONARY
+	def iterTextureTable(self, tableAddr):
+		bs = self.bs
+		numTex = readUIntAt(bs, tableAddr + self.resItemPaddingSz)
+		bs.seek(tableAddr + self.resItemPaddingSz + 24)
+		listStart = self.readPointerFixup()
+		pointerAddrs = range(listStart, listStart + 8*numTex, 8)
+		for pointer, pageID in zip(self.readUInt64s(pointerAddrs), self.pointerFixups.getPages(pointerAddrs)):
+			yield PakResItem("VRAM_DESC", self.pakPageEntries[pageID][0], pointer-32)
+
+	def getResItems(self, itemType):
+		return self.resItems.get(itemType) or []
+
+	#lods: LOD indices to keep submeshes for (negative counts from the lowest detail LOD), None for all. See readGeometry
+	def readPak(self, lods=None):
+		if self.loadCache(True):
+			if lods is not None:
+				wanted = self.getWantedLODs(lods)
+				self.submeshes = [sm for sm in self.submeshes if sm.lod in wanted]
+			return 1
+		if len(self.pakPageEntries) == 0:
+			self.readPakHeader()
+		if self.jointOffset:
+			self.readJoints()
+		if self.geoOffset:
+			self.readGeometry(lods)
+		if lods is None:
+			self.saveCache(True)
+		return 1
+
+	#Negative indexes count from the lowest detail LOD, indexes past it select nothing
+	def getWantedLODs(self, lods):
+		return set(lod % len(self.lods) if lod < 0 else lod for lod in lods if -len(self.lods) <= lod < len(self.lods))
+
+	def readJoints(self):
+
+		bs = self.bs
+		readPointerFixup = self.readPointerFixup
+		start = self.jointOffset[1]
+
+		print("Found Joint Hierarchy") # offset", self.jointOffset[0] + start, ", location:", self.jointOffset[0] + start + 20 + 32)
+		bs.seek(self.jointOffset[0] + start + 20 + self.resItemPaddingSz)
+		boneCount = bs.readUInt()
+		bs.seek(8,1)
+		xformsOffset = readPointerFixup()
+		flagsOffset = bs.readUInt64()
+		uknOffset = bs.readUInt64()
+		namesOffset = readPointerFixup()
+
+		bs.seek(xformsOffset + 16)
+		nodeCount = bs.readUShort()
+		xformCount = bs.readUShort()
+		uknCount = bs.readUShort()
+		uknShort = bs.readUShort()
+		uknHash0 = bs.readUInt()
+		uknHash1 = bs.readUInt()
+		headerSize = bs.readUInt()
+		uknInt0 = bs.readUInt()
+		uknInt1 = bs.readUInt()
+		aOffs = bs.readUInt()
+		bOffs = bs.readUInt()
+		cOffs = bs.readUInt()
+		uknInt2 = bs.readUInt()
+		hierarchyOffset = bs.readUInt()
+
+		transforms = [] #(scale, rotation, position) per transformed joint
+		parentList = []
+
+		transformsStart = xformsOffset + headerSize
+		bs.seek(transformsStart)
+		for b in range(xformCount):
+			scale = (bs.readFloat(), bs.readFloat(), bs.readFloat())
+			bs.seek(4,1)
+			rotation = (bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat())
+			position = (bs.readFloat(), bs.readFloat(), bs.readFloat())
+			bs.seek(4,1)
+			transforms.append((scale, rotation, position))
+
+		bs.seek(xformsOffset + hierarchyOffset + 20)
+		hashesSize = bs.readUInt()
+		bs.seek(hashesSize - 24, 1)
+		parentingStart = bs.tell()
+		for b in range(boneCount):
+			parentList.append((bs.readInt(), bs.readInt(), bs.readInt(), bs.readInt())) #GroupID, ParentID, ChildID, ChainID
+
+		self.jointsInfo = JointsInfo(transformsStart=transformsStart, parentingStart=parentingStart)
+
+		bs.seek(namesOffset)
+		namesTable = bs.readBytes(16*boneCount)
+		boneNames = self.readStrings([_u64.unpack_from(namesTable, 16*b + 8)[0] + start for b in range(boneCount)])
+
+		self.joints = PakJoints(names=boneNames, parents=parentList, transforms=transforms)
+		return self.joints
+
+	def readMaterialDesc(self, m_material):
+
+		bs = self.bs
+		readPointerFixup = self.readPointerFixup
+		isT2 = self.isTLOU2 or self.isTLOUP1
+
+		bs.seek(m_material)
+		shaderAssetNameOffs = readPointerFixup()
+		shaderTypeOffs = readPointerFixup()
+
+		if isT2:
+			UUID = bs.readUInt64()
+			shaderParamsOffs = readPointerFixup(True)
+			texDescsListOffs = readPointerFixup()
+			shaderNamesOffs = readPointerFixup()
+			uknOffs = readPointerFixup()
+			fetchMapDescsOffs = readPointerFixup()
+			bs.seek(52*4, 1)
+			paramCount = bs.readUInt()
+			texCount = bs.readUInt()
+			nameCount = bs.readUInt()
+			fetchMapCount = bs.readUInt()
+		else:
+			shaderOptions0Offs = readPointerFixup()
+			hashCodeOffs = readPointerFixup()
+			shaderParamsOffs = readPointerFixup()
+			texDescsListOffs = readPointerFixup()
+			shaderOptions3Offs = readPointerFixup()
+			nameCount = bs.readUInt()
+			paramCount = bs.readUInt()
+			texCount = bs.readUInt()
+			unkCount = bs.readUInt()
+
+		textures = []
+		for j in range(texCount):
+			bs.seek(texDescsListOffs + (40+8*isT2)*j )
+			nameAddr = readPointerFixup()
+			name = self.readStringAt(nameAddr)
+			bs.seek(8+8*isT2,1) #path = readStringAt(bs, readPointerFixup())
+			bs.seek(readPointerFixup())
+			path = self.readStringAt(readPointerFixup())
+			textures.append(PakTextureDesc(name=name, path=path, hash=bs.readUInt64()))
+
+		params = []
+		for j in range(paramCount):
+			bs.seek(shaderParamsOffs + 24*j)
+			name = self.readStringAt(readPointerFixup(True))
+			valueOffset = readPointerFixup()
+			numFloats = bs.readUInt()
+			bs.seek(valueOffset)
+			params.append((name, tuple(bs.readFloat() for p in range(numFloats))))
+
+		return PakMaterialDesc(name=self.readStringAt(shaderAssetNameOffs), type=self.readStringAt(shaderTypeOffs), textures=textures, params=params)
+
+	#Submeshes are only parsed (stream, skin and material descs) for the LODs in lods, None for all of them
+	def readGeometry(self, lods=None):
+
+		bs = self.bs
+		readPointerFixup = self.readPointerFixup
+		isT2 = self.isTLOU2 or self.isTLOUP1
+		start = self.geoOffset[1]
+		print("Found Geometry") # offset", self.geoOffset[0] + start)
+
+		self.submeshes = []
+		self.materials = {}
+		self.lods = []
+
+		bs.seek(self.geoOffset[0] + start + self.resItemPaddingSz)
+
+		m_version = bs.readUInt()
+		m_isForeground = bs.readUInt()
+		m_numSubMeshDesc = bs.readUInt()
+		m_numLODs = bs.readUInt()
+		m_numMaterials = bs.readUInt()
+		m_unk4 = bs.readUInt()
+		m_numShaders = bs.readUInt()
+		m_unk6 = bs.readUInt()
+		m_unk7 = bs.readUInt()
+		m_unk8 = bs.readUInt()
+		SubmeshesOffs = readPointerFixup()
+
+		self.xforms = {}
+		if isT2:
+			uknStruct = readPointerFixup()
+			m_papTransform = readPointerFixup()
+			textureDescsOffs = readPointerFixup()
+			shaderDescsOffs = readPointerFixup()
+			materialDescsOffs = readPointerFixup()
+
+			for i in range(m_numMaterials):
+				bs.seek(m_papTransform + 8*i)
+				offset = readPointerFixup()
+				bs.seek(offset)
+				mat = tuple(tuple(bs.readFloat() for c in range(4)) for r in range(4)) #4x4 rows, translation in the last row
+				bs.seek(offset + 152)
+				submeshXformsOffs = readPointerFixup()
+				numSubmeshXforms = readUIntAt(bs, offset+212)
+				for j in range(numSubmeshXforms):
+					bs.seek(submeshXformsOffs + j*112 + 64)
+					submeshOffs = readPointerFixup(True)
+					self.xforms[submeshOffs] = self.xforms.get(submeshOffs) or []
+					self.xforms[submeshOffs].append(mat)
+		else:
+			LODDescsOffs = readPointerFixup()
+			ukn0 = bs.readUInt64()
+			textureDescsOffs = readPointerFixup()
+			shaderDescsOffs = readPointerFixup()
+			ukn3 = bs.readUInt64()
+			uknFloatsOffs = readPointerFixup()
+			materialDescsOffs = readPointerFixup()
+
+		submeshLayout, pointerFields, countsIdx = (T2SubmeshDesc, T2SubmeshPointers, T2SubmeshCounts) if isT2 else (U4SubmeshDesc, U4SubmeshPointers, U4SubmeshCounts)
+		bs.seek(SubmeshesOffs)
+		submeshDescs = list(submeshLayout.iter_unpack(bs.readBytes(176*m_numSubMeshDesc)))
+		descAddrs = range(SubmeshesOffs, SubmeshesOffs + 176*m_numSubMeshDesc, 176)
+		pointers = {}
+		for field, (column, fieldOfs) in pointerFields.items():
+			pointers[field] = self.resolvePointers([addr + fieldOfs for addr in descAddrs], [desc[column] for desc in submeshDescs], isT2 and field == "indexes")
+
+		submeshNames = [sys.intern(name.split("|")[-1]) for name in self.readStrings([nameAddr or (start if isT2 else 0) for nameAddr in pointers["name"]])]
+
+		#U4/TLL list the submeshes of each LOD in a descriptor table, TLOU2/TLOUP1 LODs come from the "Shape<n>" part of the submesh names
+		submeshLODs = [getLODFromName(name) for name in submeshNames]
+		tableLODs = {}
+		if not isT2 and LODDescsOffs:
+			self.lods = self.readLODDescs(LODDescsOffs, m_numLODs, SubmeshesOffs, submeshNames)
+			for lod, lodDescs in enumerate(self.lods):
+				for lodDesc in lodDescs:
+					tableLODs.setdefault(lodDesc.offset, lod)
+		for i, addr in enumerate(descAddrs):
+			if addr in tableLODs:
+				submeshLODs[i] = tableLODs[addr]
+			else:
+				while len(self.lods) <= submeshLODs[i]:
+					self.lods.append([])
+				self.lods[submeshLODs[i]].append(LODSubmeshDesc(name=submeshNames[i], address=None, offset=addr, index=i))
+		wanted = self.getWantedLODs(lods) if lods is not None else None
+
+		for i, desc in enumerate(submeshDescs):
+			if wanted is not None and submeshLODs[i] not in wanted:
+				continue
+			submeshName = submeshNames[i]
+			m_numVertexes, m_numIndexes, m_numStreamSource = desc[countsIdx:countsIdx+3]
+			m_pStreamDesc = pointers["streamDesc"][i]
+			facesOffsetAddr = descAddrs[i] + pointerFields["indexes"][1]
+			m_pIndexes = pointers["indexes"][i]
+			m_material = pointers["material"][i]
+			skindataOffset = pointers["skin"][i]
+			nrmRecalcDescOffsOffset = descAddrs[i] + pointerFields["nrmRecalcDesc"][1]
+			nrmRecalcDescOffs = pointers["nrmRecalcDesc"][i]
+			if isT2:
+				bbox = (desc[0:4], desc[4:8])
+
+			streamDescs = []
+			m_compInfoOffs = None
+
+			for j in range(m_numStreamSource):
+
+				if isT2:
+					bs.seek(m_pStreamDesc + 64*j)
+					buffOffsAddr = bs.tell()
+					m_bufferOffset = readPointerFixup(True)
+
+					numVerts = bs.readUInt()
+					uknInt = bs.readUInt()
+					bufferSize = bs.readUInt()
+
+					m_compType = bs.readUByte()
+					m_unk2 = bs.readUByte()
+					packedNibbles = bs.readUByte()
+					m_unk3 = packedNibbles & 15
+					m_stride = packedNibbles >> 4
+					m_unk4 = bs.readUByte()
+					sizes = (bs.readUByte(), bs.readUByte(), bs.readUByte(), bs.readUByte())
+
+					uknInt0 = bs.readUInt()
+					qScale = (bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat())
+					qOffs = (bs.readFloat(), bs.readFloat(), bs.readFloat(), bs.readFloat())
+					bs.readFloat()
+					desc = T2StreamDesc(type=m_compType, offset=m_bufferOffset, stride=m_stride, bufferOffsetAddr=buffOffsAddr, sizes=sizes, qScale=qScale, qOffs=qOffs, numVerts=numVerts)
+					if desc.offset < bs.getSize():
+						streamDescs.append(desc)
+				else:
+					bs.seek(m_pStreamDesc + 24*j)
+					m_numAttributes = bs.readUByte()
+					m_unk  = bs.readUByte()
+					m_stride  = bs.readUShort()
+					m_unk2 = bs.readUByte()
+					m_unk3 = bs.readUByte()
+					m_unk4 = bs.readUShort()
+					m_compInfoOffs = readPointerFixup()
+					buffOffsAddr = bs.tell()
+					m_bufferOffset = readPointerFixup()
+
+					bs.seek(m_compInfoOffs)
+
+					m_unkC0 = bs.readUByte()
+					m_unkC1 = bs.readUByte()
+					m_unkC2 = bs.readUByte()
+					m_compType = bs.readUByte()
+
+					streamDescs.append(StreamDesc(type=m_compType, offset=m_bufferOffset, stride=m_stride, bufferOffsetAddr=buffOffsAddr))
+
+			submesh = PakSubmesh(submeshName, m_numVertexes, m_numIndexes, m_pIndexes, streamDescs, streamsAddr=m_compInfoOffs, facesOffsetAddr=facesOffsetAddr, offset=SubmeshesOffs + 176*i, material=m_material, lod=submeshLODs[i])
+			if isT2:
+				submesh.bbox = bbox
+
+			if nrmRecalcDescOffs:
+				bs.seek(nrmRecalcDescOffs)
+				indexCount = bs.readInt()
+				uknInt2 = bs.readInt()
+				ptrOffsetsStart = bs.tell()
+				ptr1 = readPointerFixup()
+				ptr2 = readPointerFixup()
+				ptr3 = readPointerFixup()
+				ptr4 = readPointerFixup()
+
+				submesh.nrmRecalcDesc = (ptr1, ptr2, ptr3, ptr4, indexCount, nrmRecalcDescOffsOffset, ptrOffsetsStart)
+
+			if skindataOffset:
+				bs.seek(skindataOffset)
+				uknSD0 = bs.readUInt()
+				numWeights = bs.readUInt()
+				uknSD2 = bs.readUInt()
+				uknSD3 = bs.readUInt()
+				bIndicesOffs = readPointerFixup(self.isTLOUP1)
+				weightsOffs = readPointerFixup(self.isTLOUP1)
+
+				submesh.skinDesc = SkinDesc(mapOffset=bIndicesOffs, weightsOffset=weightsOffs, weightCount=numWeights, mapOffsetAddr=bs.tell()-16, weightOffsetAddr=bs.tell()-8, uncompressed=(self.isTLOUP1 and uknSD2 > 0))
+
+			if m_material not in self.materials:
+				self.materials[m_material] = self.readMaterialDesc(m_material)
+
+			self.submeshes.append(submesh)
+
+		return self.submeshes
+
+	#Submesh lists of the U4/TLL LOD descriptor table. A submesh can be listed by several LODs
+	def readLODDescs(self, LODDescsOffs, numLODs, SubmeshesOffs, submeshNames):
+		bs = self.bs
+		readPointerFixup = self.readPointerFixup
+		lods = []
+		for i in range(numLODs):
+			bs.seek(LODDescsOffs + 8*i)
+			bs.seek(readPointerFixup())
+			unknown = bs.readUInt()
+			submeshCount = bs.readUInt()
+			unknown64 = bs.readUInt64()
+			collectionNameOffs = readPointerFixup()
+			firstSubmeshDescOffs = readPointerFixup()
+			submeshDescs = []
+			for s in range(submeshCount):
+				bs.seek(firstSubmeshDescOffs + 16*s)
+				submeshOffs = readPointerFixup()
+				submeshIdx = bs.readUInt()
+				nameIdx = (submeshOffs - SubmeshesOffs) // 176
+				submeshName = submeshNames[nameIdx] if 0 <= nameIdx < len(submeshNames) else ""
+				submeshDescs.append(LODSubmeshDesc(name=submeshName, address=firstSubmeshDescOffs + 16*s, offset=submeshOffs, index=submeshIdx))
+			lods.append(submeshDescs)
+		return lods
+
+#Process pool worker of PakReader.decodeSubmeshesParallel. submeshes holds only the shard, indices are their positions in the pak's submesh list
+def decodeSubmeshShard(task):
+	path, (isTLOU2, isTLOUP1), submeshes, materials, indices, readSkin, boneIdOffset = task
+	pak = openPak(path)
+	try:
+		pak.isTLOU2, pak.isTLOUP1 = isTLOU2, isTLOUP1
+		pak.submeshes = submeshes
+		pak.materials = materials
+		return [decoded._replace(index=indices[decoded.index]) for decoded in pak.iterSubmeshes(None, readSkin, boneIdOffset)]
+	finally:
+		pak.bs.close()
+
+#Micro-benchmarks of readBitFields against per-call readBits, on random data shaped like the hot paths. The baseline is streamClass.readBits:
+#PakStream (the pure-Python stand-in) by default, or NoeBitStream when called from inside Noesis, e.g. benchmarkBitReaders(streamClass=NoeBitStream)
+def benchmarkBitReaders(count=100000, repeats=3, streamClass=PakStream):
+	import time
+	cases = (("quantized position 11/11/10", (11, 11, 10)), ("skin weight 22/10", (22, 10)), ("stream desc nibbles 4/4", (4, 4)))
+	def bestOf(func):
+		best = None
+		for r in range(repeats):
+			start = time.perf_counter()
+			func()
+			elapsed = time.perf_counter() - start
+			best = elapsed if best is None else min(best, elapsed)
+		return best
+	for caseName, widths in cases:
+		data = os.urandom((count * sum(widths) + 7) >> 3)
+		def perCall():
+			bs = streamClass(data)
+			for r in range(count):
+				for width in widths:
+					bs.readBits(width)
+		timings = [(streamClass.__name__ + ".readBits", bestOf(perCall))]
+		if np is not None:
+			timings.append(("readBitFields numpy", bestOf(lambda: readBitFields(data, widths, count))))
+		timings.append(("readBitFields pure", bestOf(lambda: readBitFields(data, widths, count, useNumpy=False))))
+		print("%s, %d records:" % (caseName, count))
+		for label, elapsed in timings:
+			print("    %-24s %9.2f ms  %6.1fx" % (label, elapsed * 1000, timings[0][1] / elapsed))
+
+if __name__ == "__main__":
+	if sys.argv[1:2] == ["bench"]:
+		benchmarkBitReaders(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+	elif sys.argv[1:2] == ["texdb"] and len(sys.argv) > 2:
+		dbPath = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(sys.argv[2])[0] + ".bin"
+		print("Wrote", convertTextureHashJson(sys.argv[2], dbPath), "texture hashes to", dbPath)
+	else:
+		print("Usage: python inc_nd_pak.py bench [records]\n       python inc_nd_pak.py texdb NDTextureHashes.json [NDTextureHashes.bin]")